@@ -0,0 +1,57 @@
+#
+# This is part of "python-cluster". A library to group similar items together.
+# Copyright (C) 2006    Michel Albert
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+#
+
+"""
+Benchmarks for python-cluster.
+
+The benchmarks only depend on the standard library and run offline. Run them
+from the root of the source tree with::
+
+    python -m benchmarks
+    python -m benchmarks --sizes 100,1000 --filter hierarchical
+    python -m benchmarks --sizes 10000 --filter ward --max-size 10000
+    python -m benchmarks --json results.json
+
+Each benchmark is run on random data (with a fixed seed, so runs are
+comparable) for each requested size. The best wall time of ``--repeat`` runs
+is reported, followed by the peak memory allocated by Python during one
+additional run (measured with :py:mod:`tracemalloc`, so memory allocated in
+worker processes is not included). Sizes above the limit of a benchmark are
+skipped, unless ``--max-size`` is given.
+
+Benchmarks are registered using the :py:func:`benchmark` decorator. The
+decorated function receives the size and returns the callable to time, so
+the preparation of the data is not measured.
+"""
+
+#: All registered benchmarks as ``(name, max_size, factory)`` tuples.
+BENCHMARKS = []
+
+
+def benchmark(name, max_size=None):
+    """
+    Registers a benchmark.
+
+    :param name: The name shown in the report.
+    :param max_size: Sizes above this value are skipped. This avoids running
+        algorithms with a high complexity on sizes which would take hours.
+        The ``--max-size`` option of the runner overrides it.
+    """
+    def decorator(factory):
+        BENCHMARKS.append((name, max_size, factory))
+        return factory
+    return decorator
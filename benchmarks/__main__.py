@@ -0,0 +1,92 @@
+#
+# This is part of "python-cluster". A library to group similar items together.
+# Copyright (C) 2006    Michel Albert
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+#
+
+"""
+Command line runner for the benchmarks. See :py:mod:`benchmarks`.
+"""
+
+from __future__ import print_function
+
+from argparse import ArgumentParser
+import json
+import timeit
+import tracemalloc
+
+from benchmarks import BENCHMARKS
+import benchmarks.bench_cluster  # NOQA (registers the benchmarks)
+
+
+def measure(run, repeat):
+    """
+    Returns the best wall time (in seconds) of *repeat* runs and the peak
+    memory (in bytes) allocated during one more run.
+    """
+    seconds = min(timeit.repeat(run, number=1, repeat=repeat))
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def parse_args():
+    parser = ArgumentParser(description='Run the python-cluster benchmarks')
+    parser.add_argument('--sizes', default='100,300,1000',
+                        help='Comma-separated list of data sizes '
+                        '(default: %(default)s)')
+    parser.add_argument('--filter', default='',
+                        help='Only run benchmarks containing this text')
+    parser.add_argument('--max-size', type=int,
+                        help='Run all benchmarks up to this size, instead of '
+                        'skipping sizes above the limit of each benchmark')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of timed runs (default: %(default)s)')
+    parser.add_argument('--json', metavar='FILENAME',
+                        help='Also write the results to this file')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+    results = []
+    print('%-55s %7s %12s %12s' % ('benchmark', 'size', 'seconds', 'peak MiB'))
+    for name, max_size, factory in BENCHMARKS:
+        if args.filter.lower() not in name.lower():
+            continue
+        if args.max_size is not None:
+            max_size = args.max_size
+        for size in sizes:
+            if max_size is not None and size > max_size:
+                print('%-55s %7d %12s %12s' % (name, size, 'skipped', '-'))
+                continue
+            seconds, peak = measure(factory(size), args.repeat)
+            print('%-55s %7d %12.4f %12.2f' % (name, size, seconds,
+                                               peak / 1024.0 / 1024.0))
+            results.append({'benchmark': name,
+                             'size': size,
+                             'seconds': seconds,
+                             'peak_bytes': peak})
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+#
+# This is part of "python-cluster". A library to group similar items together.
+# Copyright (C) 2006    Michel Albert
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+#
+
+"""
+Benchmarks of the clustering methods and the item-item matrix.
+"""
+
+from random import Random
+
+from cluster import (HierarchicalClustering, KMeansClustering,
+                     SingleLinkageClustering)
+from cluster.cluster import Cluster
+from cluster.matrix import Matrix
+
+from benchmarks import benchmark
+
+SEED = 4711
+
+
+def distance(x, y):
+    return abs(x - y)
+
+
+def scalars(size):
+    rng = Random(SEED)
+    return [rng.random() * 1000 for _ in range(size)]
+
+
+def vectors(size, dimensions=2):
+    rng = Random(SEED)
+    return [tuple(rng.random() * 1000 for _ in range(dimensions))
+            for _ in range(size)]
+
+
+def _matrix(size, storage, executor, num_processes):
+    data = scalars(size)
+
+    def combine(a, b):
+        return distance(a[0], b[0])
+
+    def run():
+        matrix = Matrix(data, combine, True, 0, storage, executor)
+        matrix.genmatrix(num_processes)
+        if storage == 'mapped':
+            matrix.matrix.close()
+    return run
+
+
+@benchmark('Matrix.genmatrix (serial)')
+def matrix_serial(size):
+    return _matrix(size, 'list', 'serial', 1)
+
+
+@benchmark('Matrix.genmatrix (4 processes)')
+def matrix_processes_list(size):
+    return _matrix(size, 'list', 'processes', 4)
+
+
+@benchmark('Matrix.genmatrix (4 threads)')
+def matrix_threads_list(size):
+    return _matrix(size, 'list', 'threads', 4)
+
+
+@benchmark('Matrix.genmatrix (serial, condensed)')
+def matrix_serial_condensed(size):
+    return _matrix(size, 'condensed', 'serial', 1)
+
+
+@benchmark('Matrix.genmatrix (4 processes, condensed)')
+def matrix_processes(size):
+    return _matrix(size, 'condensed', 'processes', 4)
+
+
+@benchmark('Matrix.genmatrix (4 threads, condensed)')
+def matrix_threads(size):
+    return _matrix(size, 'condensed', 'threads', 4)
+
+
+@benchmark('Matrix.genmatrix (serial, mapped)')
+def matrix_serial_mapped(size):
+    return _matrix(size, 'mapped', 'serial', 1)
+
+
+def _hierarchical(linkage, storage='list'):
+    def factory(size):
+        data = scalars(size)
+
+        def run():
+            HierarchicalClustering(data, distance, linkage,
+                                   storage=storage).cluster()
+        return run
+    return factory
+
+
+for _linkage in ('single', 'complete', 'average', 'ward'):
+    benchmark('HierarchicalClustering.cluster (%s)' % _linkage,
+              max_size=5000)(_hierarchical(_linkage))
+benchmark('HierarchicalClustering.cluster (single, condensed)',
+          max_size=5000)(_hierarchical('single', 'condensed'))
+benchmark('HierarchicalClustering.cluster (uclus)',
+          max_size=1000)(_hierarchical('uclus'))
+
+
+@benchmark('SingleLinkageClustering.cluster')
+def single_linkage_mst(size):
+    data = scalars(size)
+
+    def run():
+        SingleLinkageClustering(data, distance).cluster()
+    return run
+
+
+@benchmark('HierarchicalClustering.from_distances (single)', max_size=5000)
+def hierarchical_precomputed(size):
+    data = scalars(size)
+    distances = [[distance(x, y) for y in data] for x in data]
+
+    def run():
+        HierarchicalClustering.from_distances(distances, data).cluster()
+    return run
+
+
+@benchmark('Cluster.getlevel', max_size=5000)
+def getlevel(size):
+    data = scalars(size)
+    cl = HierarchicalClustering(data, distance)
+    cl.cluster()
+    root = cl.data[0]
+    threshold = root.level / 10
+    nodes = [root]
+    for node in nodes:
+        nodes.extend(item for item in node.items if isinstance(item, Cluster))
+
+    def run():
+        # Cluster.leaves() is memoised; forget it so that each run measures
+        # the first call on a fresh tree
+        for node in nodes:
+            node._leaves = None
+        root.getlevel(threshold)
+    return run
+
+
+def _kmeans(count, update='online'):
+    def factory(size):
+        data = vectors(size)
+
+        def run():
+            KMeansClustering(data, update=update).getclusters(count)
+        return run
+    return factory
+
+
+for _count in (2, 8, 32):
+    benchmark('KMeansClustering.getclusters (k=%d)' % _count,
+              max_size=5000)(_kmeans(_count))
+    benchmark('KMeansClustering.getclusters (k=%d, batch)' % _count)(
+        _kmeans(_count, 'batch'))
@@ -18,8 +18,9 @@
 
 from pkg_resources import resource_string
 
-from .method.hierarchical import HierarchicalClustering
-from .method.kmeans import KMeansClustering
+from .method.hierarchical import (HierarchicalClustering,
+                                  SingleLinkageClustering)
+from .method.kmeans import KMeansClustering, MiniBatchKMeansClustering
 from .util import ClusteringError
 
 __version__ = resource_string('cluster', 'version.txt').decode('ascii').strip()
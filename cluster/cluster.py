@@ -16,8 +16,8 @@
 #
 
 from __future__ import print_function
-
-from .util import fullyflatten
+from array import array
+from bisect import insort
 
 
 class Cluster(object):
@@ -28,6 +28,9 @@ class Cluster(object):
     clusters of lists with this class.
     """
 
+    #: The memoised result of :py:meth:`leaves`
+    _leaves = None
+
     def __repr__(self):
         return "<Cluster@%s(%s)>" % (self.level, self.items)
 
@@ -53,23 +56,46 @@ class Cluster(object):
             self.items = args
 
     def __iter__(self):
-        for item in self.items:
-            if isinstance(item, Cluster):
-                for recursed_item in item:
-                    yield recursed_item
-            else:
-                yield item
+        return iter(self.leaves())
+
+    def leaves(self):
+        """
+        Returns the items of this cluster and all its sub-clusters, from left
+        to right. The list is computed only once and must not be modified.
+        """
+        if self._leaves is None:
+            leaves = []
+            stack = [iter(self.items)]
+            while stack:
+                for item in stack[-1]:
+                    if not isinstance(item, Cluster):
+                        leaves.append(item)
+                    elif item._leaves is not None:
+                        leaves.extend(item._leaves)
+                    else:
+                        stack.append(iter(item.items))
+                        break
+                else:
+                    stack.pop()
+            self._leaves = leaves
+        return self._leaves
 
     def display(self, depth=0):
         """
         Pretty-prints this cluster. Useful for debuging.
         """
-        print(depth * "    " + "[level %s]" % self.level)
-        for item in self.items:
-            if isinstance(item, Cluster):
-                item.display(depth + 1)
-            else:
+        stack = [(self, depth)]
+        while stack:
+            item, depth = stack.pop()
+            if not isinstance(item, Cluster):
                 print(depth * "    " + "%s" % item)
+                continue
+            print(depth * "    " + "[level %s]" % item.level)
+            for child in reversed(item.items):
+                if isinstance(child, Cluster):
+                    stack.append((child, depth + 1))
+                else:
+                    stack.append((child, depth))
 
     def topology(self):
         """
@@ -93,20 +119,20 @@ class Cluster(object):
                 ('.idlerc', '.pylint.d')))))))
         """
 
-        left = self.items[0]
-        right = self.items[1]
-
-        if isinstance(left, Cluster):
-            first = left.topology()
-        else:
-            first = left
-
-        if isinstance(right, Cluster):
-            second = right.topology()
-        else:
-            second = right
-
-        return first, second
+        results = {}
+        stack = [self]
+        while stack:
+            cluster = stack[-1]
+            pending = [item for item in cluster.items
+                       if isinstance(item, Cluster) and id(item) not in results]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            results[id(cluster)] = tuple(
+                results.pop(id(item)) if isinstance(item, Cluster) else item
+                for item in cluster.items)
+        return results[id(self)]
 
     def getlevel(self, threshold):
         """
@@ -127,36 +153,316 @@ class Cluster(object):
             useful approach.
         """
 
-        left = self.items[0]
-        right = self.items[1]
+        # Clusters which are below the threshold are returned as a whole.
+        # Clusters above the threshold are split up into their items, which are
+        # investigated in turn (from left to right).
+        output = []
+        stack = [self]
+        while stack:
+            item = stack.pop()
+            if not isinstance(item, Cluster):
+                output.append([item])
+            elif item.level <= threshold:
+                output.append(list(item.leaves()))
+            else:
+                stack.extend(reversed(item.items))
+        return output
 
-        # if this object itself is below the threshold value we only need to
-        # return it's contents as a list
-        if self.level <= threshold:
-            return [fullyflatten(self.items)]
 
-        # if this cluster's level is higher than the threshold we will
-        # investgate it's left and right part. Their level could be below the
-        # threshold
-        if isinstance(left, Cluster) and left.level <= threshold:
-            if isinstance(right, Cluster):
-                return [fullyflatten(left.items)] + right.getlevel(threshold)
-            else:
-                return [fullyflatten(left.items)] + [[right]]
-        elif isinstance(right, Cluster) and right.level <= threshold:
-            if isinstance(left, Cluster):
-                return left.getlevel(threshold) + [fullyflatten(right.items)]
+class LinkageTree(object):
+    """
+    A compact representation of the result of a hierarchical clustering.
+
+    Instead of nested :py:class:`Cluster` instances, the tree is stored as a
+    list of leaves and one merge record per internal node, similar to the
+    "linkage matrix" of other libraries. The leaves are numbered from ``0`` to
+    ``n - 1``, and the node created by the *m*-th merge gets the number
+    ``n + m``. Each merge record contains the two merged nodes, the level of the
+    merge and the number of leaves below the new node. The records are kept in
+    flat arrays which need a fraction of the memory of :py:class:`Cluster`
+    instances.
+
+    The tree supports the same operations as the top-level :py:class:`Cluster`
+    (iteration, :py:meth:`getlevel`, :py:meth:`topology` and
+    :py:meth:`display`) without creating any :py:class:`Cluster` instance. If
+    needed, these can still be created using :py:meth:`cluster`.
+
+    :param leaves: The clustered items.
+    """
+
+    def __init__(self, leaves):
+        self.leaves = list(leaves)
+        self.left = array('l')
+        self.right = array('l')
+        self.levels = array('d')
+        self.sizes = array('l')
+        self._order = None
+        self._ranked = None
+
+    def __repr__(self):
+        return "<LinkageTree(%s leaves, %s merges)>" % (
+            len(self.leaves), len(self.left))
+
+    def add(self, left, right, level):
+        """
+        Records the merge of the nodes *left* and *right* at *level*.
+
+        :return: The number of the new node.
+        """
+        self.left.append(left)
+        self.right.append(right)
+        try:
+            self.levels.append(level)
+        except TypeError:
+            # non-numeric (but comparable) levels
+            self.levels = list(self.levels)
+            self.levels.append(level)
+        self.sizes.append(self.size(left) + self.size(right))
+        self._order = None
+        self._ranked = None
+        return len(self.leaves) + len(self.left) - 1
+
+    @property
+    def merges(self):
+        """
+        The merge records as list of ``(left, right, level, size)`` tuples.
+        """
+        return list(zip(self.left, self.right, self.levels, self.sizes))
+
+    @property
+    def root(self):
+        """
+        The number of the top-level node.
+        """
+        return len(self.leaves) + len(self.left) - 1
+
+    @property
+    def level(self):
+        """
+        The level of the top-level node (like :py:attr:`Cluster.level`).
+        """
+        return self.levels[-1] if self.levels else 0
+
+    def is_leaf(self, node):
+        return node < len(self.leaves)
+
+    def size(self, node):
+        """
+        Returns the number of leaves below *node*.
+        """
+        if self.is_leaf(node):
+            return 1
+        return self.sizes[node - len(self.leaves)]
+
+    def children(self, node):
+        """
+        Returns the two nodes merged into *node*.
+        """
+        merge = node - len(self.leaves)
+        return self.left[merge], self.right[merge]
+
+    def leaf_order(self, node=None):
+        """
+        Returns the numbers of the leaves below *node* (by default the
+        top-level node), from left to right.
+        """
+        if node is None:
+            if self._order is None:
+                self._order = self.leaf_order(self.root)
+            return self._order
+        order = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if self.is_leaf(node):
+                order.append(node)
             else:
-                return [[left]] + [fullyflatten(right.items)]
-
-        # Alright. We covered the cases where one of the clusters was below
-        # the threshold value. Now we'll deal with the clusters that are above
-        # by recursively applying the previous cases.
-        if isinstance(left, Cluster) and isinstance(right, Cluster):
-            return left.getlevel(threshold) + right.getlevel(threshold)
-        elif isinstance(left, Cluster):
-            return left.getlevel(threshold) + [[right]]
-        elif isinstance(right, Cluster):
-            return [[left]] + right.getlevel(threshold)
-        else:
-            return [[left], [right]]
+                left, right = self.children(node)
+                stack.append(right)
+                stack.append(left)
+        return order
+
+    def __iter__(self):
+        for leaf in self.leaf_order():
+            yield self.leaves[leaf]
+
+    def topology(self, node=None):
+        """
+        Returns the structure of the tree as nested tuples. See
+        :py:meth:`Cluster.topology`.
+        """
+        if node is None:
+            node = self.root
+        if self.is_leaf(node):
+            return self.leaves[node]
+        results = {}
+        stack = [node]
+        while stack:
+            current = stack[-1]
+            left, right = self.children(current)
+            pending = [child for child in (left, right)
+                       if not self.is_leaf(child) and child not in results]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            results[current] = tuple(
+                results.pop(child) if child in results else self.leaves[child]
+                for child in (left, right))
+        return results[node]
+
+    def cluster(self, node=None):
+        """
+        Creates the :py:class:`Cluster` instance for *node* (by default the
+        top-level node), including all its sub-clusters.
+        """
+        if node is None:
+            node = self.root
+        if self.is_leaf(node):
+            return self.leaves[node]
+        offset = len(self.leaves)
+        first = node - offset
+        # all merges below the node come before it, so they can be created
+        # in order without recursion.
+        clusters = {}
+        wanted = set([node])
+        for merge in range(first, -1, -1):
+            if merge + offset in wanted:
+                wanted.update((self.left[merge], self.right[merge]))
+        for merge in range(first + 1):
+            if merge + offset not in wanted:
+                continue
+            children = [clusters.pop(child) if child in clusters
+                        else self.leaves[child]
+                        for child in (self.left[merge], self.right[merge])]
+            clusters[merge + offset] = Cluster(self.levels[merge], *children)
+        return clusters[node]
+
+    def display(self, depth=0):
+        """
+        Pretty-prints the tree like :py:meth:`Cluster.display`.
+        """
+        stack = [(self.root, depth)]
+        while stack:
+            node, depth = stack.pop()
+            if self.is_leaf(node):
+                print(depth * "    " + "%s" % self.leaves[node])
+                continue
+            print(depth * "    " + "[level %s]" % self.levels[
+                node - len(self.leaves)])
+            left, right = self.children(node)
+            for child in (right, left):
+                if self.is_leaf(child):
+                    stack.append((child, depth))
+                else:
+                    stack.append((child, depth + 1))
+
+    def getlevel(self, threshold):
+        """
+        Retrieve all clusters up to a specific level threshold. See
+        :py:meth:`Cluster.getlevel`, which returns the same clusters in the
+        same order.
+
+        A node is returned as a whole if its level, or the level of one of its
+        ancestors, is below or equal to the threshold. Each pair of leaves
+        which are neighbours in the leaf order is separated by exactly one
+        internal node, so the clusters are found by splitting the leaf order
+        wherever that node is not returned as a whole.
+        """
+        return self.getlevels([threshold])[0]
+
+    def getlevels(self, thresholds):
+        """
+        Returns the result of :py:meth:`getlevel` for each of *thresholds*.
+
+        The gaps between neighbouring leaves are ranked by level only once.
+        The thresholds are then handled from the highest to the lowest, so
+        each one only adds the gaps which were not yet split by the previous
+        one.
+
+        :return: A list containing one list of clusters for each threshold.
+        """
+        ranked, effective = self._ranked_gaps()
+        items = list(self)
+        cuts = []
+        position = 0
+        output = [None] * len(thresholds)
+        for index in sorted(range(len(thresholds)),
+                            key=thresholds.__getitem__, reverse=True):
+            threshold = thresholds[index]
+            while (position < len(ranked) and
+                   effective[ranked[position][1]] > threshold):
+                insort(cuts, ranked[position][0] + 1)
+                position += 1
+            output[index] = _split(items, cuts)
+        return output
+
+    def cut_k(self, k):
+        """
+        Returns exactly *k* clusters by undoing the ``k - 1`` merges with the
+        highest levels. The clusters are ordered like in
+        :py:meth:`getlevel`.
+        """
+        if not 1 <= k <= len(self.leaves):
+            raise ValueError('k must be between 1 and the number of items')
+        ranked, _ = self._ranked_gaps()
+        cuts = sorted(gap + 1 for gap, _ in ranked[:k - 1])
+        return _split(list(self), cuts)
+
+    def effective_levels(self):
+        """
+        Returns the "effective" level of each merge: the smallest level of the
+        merge itself and all its ancestors. A merge is contained in the result
+        of :py:meth:`getlevel` if its effective level is below or equal to
+        the threshold.
+        """
+        effective = list(self.levels)
+        offset = len(self.leaves)
+        # parents always come after their children
+        for merge in range(len(effective) - 1, -1, -1):
+            for child in (self.left[merge], self.right[merge]):
+                if child >= offset and effective[merge] < effective[
+                        child - offset]:
+                    effective[child - offset] = effective[merge]
+        return effective
+
+    def gaps(self):
+        """
+        Returns, for each pair of neighbouring leaves in the leaf order, the
+        merge which joins them.
+        """
+        offset = len(self.leaves)
+        position = dict((leaf, index)
+                        for index, leaf in enumerate(self.leaf_order()))
+        gaps = [None] * (offset - 1)
+        # The rightmost leaf of the left child is the left neighbour of the
+        # leftmost leaf of the right child.
+        last = list(range(offset)) + [None] * len(self.left)
+        for merge in range(len(self.left)):
+            left, right = self.left[merge], self.right[merge]
+            last[offset + merge] = last[right]
+            gaps[position[last[left]]] = merge
+        return gaps
+
+    def _ranked_gaps(self):
+        """
+        Returns the ``(position, merge)`` pairs of :py:meth:`gaps`, the gap
+        with the highest effective level first, together with the effective
+        levels. Ties are broken by merge order, so a merge is always ranked
+        after all its ancestors.
+        """
+        if self._ranked is None:
+            effective = self.effective_levels()
+            ranked = sorted(enumerate(self.gaps()),
+                            key=lambda gap: (effective[gap[1]], gap[1]),
+                            reverse=True)
+            self._ranked = ranked, effective
+        return self._ranked
+
+
+def _split(items, cuts):
+    """
+    Splits *items* before each of the (sorted) positions in *cuts*.
+    """
+    bounds = [0] + cuts + [len(items)]
+    return [items[start:end] for start, end in zip(bounds, bounds[1:])]
@@ -1,30 +1,119 @@
 from __future__ import division
-from functools import wraps
+from collections import OrderedDict
+from math import sqrt
 
+from .cluster import Cluster
+from .util import centroid, mean
 
-def cached(fun):
+
+#: The default number of entries kept in a :py:class:`LinkageCache`.
+DEFAULT_CACHE_SIZE = 100000
+
+
+class LinkageCache(object):
     """
-    memoizing decorator for linkage functions.
+    A bounded memo for linkage values.
+
+    Each clustering run should use its own cache. Entries are keyed on the
+    linkage method, the distance function and both collections, so different
+    runs or metrics never share values. Once *maxsize* entries are stored, the
+    least recently used entry is dropped. The entries of a collection which
+    will no longer be looked up (like a cluster which has been merged into a
+    bigger one) can be dropped using :py:meth:`discard`.
 
-    Parameters have been hardcoded (no ``*args``, ``**kwargs`` magic), because,
-    the way this is coded (interchangingly using sets and frozensets) is true
-    for this specific case. For other cases that is not necessarily guaranteed.
+    Example::
+
+        >>> cache = LinkageCache(maxsize=1000)
+        >>> cache(average, [1, 2], [3, 4], lambda x, y: abs(x-y))
+        2.0
+        >>> cache.misses
+        1
+
+    :param maxsize: The maximum number of entries. ``None`` means unlimited,
+        ``0`` disables caching.
     """
 
-    _cache = {}
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # the keys of the entries of each collection
+        self._collections = {}
+
+    @staticmethod
+    def key(collection):
+        """
+        Returns a hashable key for a collection of items. Clusters are
+        identified by identity, other collections by their content.
+        """
+        if isinstance(collection, Cluster):
+            return collection
+        return tuple(collection)
 
-    @wraps(fun)
-    def newfun(a, b, distance_function):
-        frozen_a = frozenset(a)
-        frozen_b = frozenset(b)
-        if (frozen_a, frozen_b) not in _cache:
-            result = fun(a, b, distance_function)
-            _cache[(frozen_a, frozen_b)] = result
-        return _cache[(frozen_a, frozen_b)]
-    return newfun
+    def __call__(self, linkage, a, b, distance_function):
+        """
+        Returns ``linkage(a, b, distance_function)``, computing it only if it
+        is not yet known.
+        """
+        if self.maxsize == 0:
+            self.misses += 1
+            return linkage(a, b, distance_function)
+
+        key = (linkage, distance_function, self.key(a), self.key(b))
+        try:
+            result = self._entries.pop(key)
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            self._entries[key] = result
+            return result
+
+        result = linkage(a, b, distance_function)
+        self.misses += 1
+        if (self.maxsize is not None and
+                len(self._entries) >= self.maxsize):
+            self._forget(self._entries.popitem(last=False)[0])
+        self._entries[key] = result
+        for collection in key[2:]:
+            self._collections.setdefault(collection, set()).add(key)
+        return result
+
+    def _forget(self, key):
+        """
+        Removes the entry *key* from the entries of its collections.
+        """
+        for collection in key[2:]:
+            keys = self._collections.get(collection)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._collections[collection]
+
+    def discard(self, collection):
+        """
+        Drops all entries involving *collection*.
+        """
+        for key in self._collections.pop(self.key(collection), ()):
+            self._entries.pop(key, None)
+            self._forget(key)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self, counters=True):
+        """
+        Drops all entries. The hit and miss counters are reset as well, unless
+        *counters* is ``False``.
+        """
+        self._entries.clear()
+        self._collections.clear()
+        if counters:
+            self.hits = 0
+            self.misses = 0
 
 
-@cached
 def single(a, b, distance_function):
     """
     Given two collections ``a`` and ``b``, this will return the distance of the
@@ -36,14 +125,9 @@ def single(a, b, distance_function):
         >>> single([1, 2], [3, 4], lambda x, y: abs(x-y))
         1  # (distance between 2 and 3)
     """
-    left_a, right_a = min(a), max(a)
-    left_b, right_b = min(b), max(b)
-    result = min(distance_function(left_a, right_b),
-                 distance_function(left_b, right_a))
-    return result
+    return min(distance_function(x, y) for x in a for y in b)
 
 
-@cached
 def complete(a, b, distance_function):
     """
     Given two collections ``a`` and ``b``, this will return the distance of the
@@ -52,17 +136,12 @@ def complete(a, b, distance_function):
 
     Example::
 
-        >>> single([1, 2], [3, 4], lambda x, y: abs(x-y))
+        >>> complete([1, 2], [3, 4], lambda x, y: abs(x-y))
         3  # (distance between 1 and 4)
     """
-    left_a, right_a = min(a), max(a)
-    left_b, right_b = min(b), max(b)
-    result = max(distance_function(left_a, right_b),
-                 distance_function(left_b, right_a))
-    return result
+    return max(distance_function(x, y) for x in a for y in b)
 
 
-@cached
 def average(a, b, distance_function):
     """
     Given two collections ``a`` and ``b``, this will return the mean of all
@@ -79,7 +158,6 @@ def average(a, b, distance_function):
     return sum(distances) / len(distances)
 
 
-@cached
 def uclus(a, b, distance_function):
     """
     Given two collections ``a`` and ``b``, this will return the *median* of all
@@ -91,10 +169,162 @@ def uclus(a, b, distance_function):
         >>> single([1, 2], [3, 100], lambda x, y: abs(x-y))
         2.5
     """
-    distances = sorted([distance_function(x, y)
-                        for x in a for y in b])
-    midpoint, rest = len(distances) // 2, len(distances) % 2
+    return _median([distance_function(x, y) for x in a for y in b])
+
+
+def ward(a, b, distance_function):
+    """
+    Given two collections ``a`` and ``b`` of numbers or numeric vectors, this
+    will return the distance of Ward's minimum variance method: the square
+    root of twice the increase of the sum of squared errors when both
+    collections are merged. For two single items, this is the distance
+    between them. ``distance_function`` is used to determine the distance
+    between the means of both collections, and should be the euclidean
+    distance (see :py:func:`~cluster.util.minkowski_distance`).
+
+    Example::
+
+        >>> ward([(0, 0), (0, 2)], [(4, 1)], minkowski_distance)
+        4.618802153517006  # sqrt(2 * 2 * 1 / 3) * 4
+    """
+    a, b = list(a), list(b)
+    return (sqrt(2 * len(a) * len(b) / (len(a) + len(b))) *
+            distance_function(_mean(a), _mean(b)))
+
+
+def _mean(items):
+    if hasattr(items[0], '__len__'):
+        return centroid(items, mean)
+    return mean(items)
+
+
+def _median(values):
+    values = sorted(values)
+    midpoint, rest = len(values) // 2, len(values) % 2
     if not rest:
-        return sum(distances[midpoint-1:midpoint+1]) / 2
+        return sum(values[midpoint-1:midpoint+1]) / 2
     else:
-        return distances[midpoint]
+        return values[midpoint]
+
+
+def _single_update(d_ki, d_kj, d_ij, size_i, size_j, size_k):
+    return min(d_ki, d_kj)
+
+
+def _complete_update(d_ki, d_kj, d_ij, size_i, size_j, size_k):
+    return max(d_ki, d_kj)
+
+
+def _average_update(s_ki, s_kj, s_ij, size_i, size_j, size_k):
+    return s_ki + s_kj
+
+
+def _ward_update(d_ki, d_kj, d_ij, size_i, size_j, size_k):
+    squared = ((size_k + size_i) * d_ki ** 2 +
+               (size_k + size_j) * d_kj ** 2 -
+               size_k * d_ij ** 2) / (size_i + size_j + size_k)
+    # rounding errors must not lead to negative values
+    return sqrt(max(squared, 0))
+
+
+#: Lance-Williams update rules for the built-in linkage methods.
+#:
+#: When the clusters ``i`` and ``j`` are merged, the rule returns the distance
+#: between any other cluster ``k`` and the new cluster using only the
+#: previously known distances ``d_ki``, ``d_kj`` and ``d_ij`` and the cluster
+#: sizes. This avoids looking at the individual items again. Linkage methods
+#: without an entry (like :py:func:`uclus` or user-supplied callables) are
+#: computed from the item-item distances (see :py:data:`INDEX_LINKAGES`).
+UPDATE_RULES = {
+    single: _single_update,
+    complete: _complete_update,
+    average: _average_update,
+    ward: _ward_update,
+}
+
+#: Linkage methods whose update rule operates on the *sum* of all item-item
+#: distances between two clusters instead of the linkage value itself. The
+#: linkage value is obtained by dividing the sum by the product of both cluster
+#: sizes. Unlike a weighted mean, this gives exactly the same values as calling
+#: :py:func:`average` directly (at least for integer distances).
+SUMMED_LINKAGES = frozenset([average])
+
+
+def _single_indices(a, b, distances):
+    return min(distances.values(a, b))
+
+
+def _complete_indices(a, b, distances):
+    return max(distances.values(a, b))
+
+
+def _average_indices(a, b, distances):
+    return sum(distances.values(a, b)) / (len(a) * len(b))
+
+
+def _uclus_indices(a, b, distances):
+    return _median(distances.values(a, b))
+
+
+#: Index-based versions of the built-in linkage methods.
+#:
+#: They take two sequences of item positions and the
+#: :py:class:`~cluster.matrix.DistanceMatrix` of all items, so the distance
+#: between two items is only ever computed once. Other linkage methods are
+#: wrapped in an :py:class:`ItemLinkage`.
+INDEX_LINKAGES = {
+    single: _single_indices,
+    complete: _complete_indices,
+    average: _average_indices,
+    uclus: _uclus_indices,
+}
+
+
+class ItemLinkage(object):
+    """
+    Adapts a linkage method which takes two collections of items and a
+    distance function (like :py:func:`uclus`) to the interface of
+    :py:data:`INDEX_LINKAGES`. The linkage method receives lists of the items
+    at the given positions, and a distance function which looks the distances
+    up in the matrix instead of computing them. Other values (like the
+    centroid of a collection) are passed to *distance_function*.
+
+    Example::
+
+        >>> from cluster.matrix import DistanceMatrix
+        >>> linkage = ItemLinkage(uclus, ['a', 'b', 'c'])
+        >>> linkage([0, 1], [2], DistanceMatrix([1, 4, 2]))
+        3.0
+
+    :param linkage: The linkage method.
+    :param items: The items. They do not need to be hashable: they are
+        identified by their identity.
+    :param distance_function: The function to determine the distance between
+        values which are not one of *items*.
+    """
+
+    def __init__(self, linkage, items, distance_function=None):
+        self.linkage = linkage
+        self.items = items
+        self.distance_function = distance_function
+        self._positions = None
+
+    def __call__(self, a, b, distances):
+        if self._positions is None:
+            self._positions = {}
+            for position, item in enumerate(self.items):
+                self._positions.setdefault(id(item), position)
+        positions = self._positions
+
+        def distance_function(x, y):
+            try:
+                return distances[positions[id(x)], positions[id(y)]]
+            except KeyError:
+                if self.distance_function is None:
+                    raise ValueError('The distance of values which are not '
+                                     'items requires a distance function')
+                return self.distance_function(x, y)
+
+        return self.linkage([self.items[position] for position in a],
+                            [self.items[position] for position in b],
+                            distance_function)
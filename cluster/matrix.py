@@ -16,8 +16,20 @@
 #
 
 
+from array import array
 import logging
-from multiprocessing import Process, Queue, current_process
+from math import sqrt
+import mmap
+from operator import itemgetter
+from multiprocessing.sharedctypes import RawArray
+import tempfile
+
+from .workers import WorkerPool, check_executor
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 logger = logging.getLogger(__name__)
@@ -59,12 +71,401 @@ def _encapsulate_item_for_combinfunc(item):
     return encapsulated_item
 
 
+def _compute_row(items, combinfunc, row_index, symmetric, diagonal):
+    """
+    Computes the cells of one row of a matrix. For symmetric matrices, only the
+    cells starting at the diagonal are computed.
+
+    :param items: The items of the matrix, already encapsulated using
+        :py:func:`_encapsulate_item_for_combinfunc`.
+    """
+    item = items[row_index]
+    first_col = row_index if symmetric else 0
+    cells = []
+    for col_index in range(first_col, len(items)):
+        if diagonal is not None and col_index == row_index:
+            cells.append(diagonal)
+        else:
+            cells.append(combinfunc(item, items[col_index]))
+    return cells
+
+
+#: The possible values for the *storage* of a :py:class:`Matrix`.
+STORAGES = ('list', 'condensed', 'mapped')
+
+#: The maximum number of cells in a block of rows computed by a worker for
+#: ``'mapped'`` storage. Each block is sent back as a list of Python floats,
+#: so this bounds the memory used by a result independently of the size of the
+#: matrix (2**20 cells need about 32 MiB).
+MAPPED_BLOCK_CELLS = 2 ** 20
+
+
+def _as_doubles(buffer):
+    """
+    Returns a fast, writable view of doubles on a shared *buffer*.
+    """
+    try:
+        return memoryview(buffer).cast('B').cast('d')
+    except (AttributeError, TypeError):
+        # Python 2 has no memoryview.cast()
+        return buffer
+
+
+def _initialise_worker(data, combinfunc, symmetric, diagonal, buffer, state):
+    """
+    Initialiser of the workers of a :py:class:`Matrix` (see
+    :py:class:`~cluster.workers.WorkerPool`).
+    """
+    if buffer is not None:
+        state['buffer'] = _as_doubles(buffer)
+    state['items'] = [_encapsulate_item_for_combinfunc(item) for item in data]
+    state['combinfunc'] = combinfunc
+    state['symmetric'] = symmetric
+    state['diagonal'] = diagonal
+
+
+def _compute_rows(task, state):
+    """
+    Worker task: computes the rows ``start`` to ``stop`` (exclusive).
+    """
+    start, stop = task
+    rows = [_compute_row(state['items'],
+                         state['combinfunc'],
+                         row_index,
+                         state['symmetric'],
+                         state['diagonal'])
+            for row_index in range(start, stop)]
+    return start, rows
+
+
+def _fill_condensed(task, state):
+    """
+    Worker task: computes the rows ``start`` to ``stop`` (exclusive) of a
+    condensed matrix and writes them directly into the shared buffer. Nothing
+    but the row range is returned.
+    """
+    start, stop = task
+    items = state['items']
+    size = len(items)
+    buffer = state['buffer']
+    offset = size * start - start * (start + 1) // 2
+    for row_index in range(start, stop):
+        cells = _compute_row(items,
+                             state['combinfunc'],
+                             row_index,
+                             True,
+                             state['diagonal'])
+        buffer[offset:offset + len(cells) - 1] = array('d', cells[1:])
+        offset += len(cells) - 1
+    return start, stop
+
+
+def _group_items(data, items, group):
+    if len(group) == 1:
+        return items[group[0]]
+    return [data[index] for index in group]
+
+
+class CondensedMatrix(object):
+    """
+    A symmetric matrix with a constant diagonal, storing only the cells above
+    the diagonal as a flat array of ``n * (n - 1) / 2`` double-precision
+    floats. This uses a fraction of the memory of a list of lists.
+
+    Cells can be accessed using ``matrix[i][j]`` (like a list of lists) or
+    ``matrix[i, j]``. Both ``matrix[i][j]`` and ``matrix[j][i]`` refer to the
+    same cell.
+
+    :param size: The number of rows (and columns).
+    :param diagonal: The value of the cells on the diagonal. These cells
+        cannot be modified.
+    :param values: An existing sequence of ``n * (n - 1) / 2`` floats to use
+        as storage (for example a shared memory buffer). By default, a new
+        array is allocated.
+    """
+
+    def __init__(self, size, diagonal=0, values=None):
+        self.size = size
+        self.diagonal = diagonal
+        if values is None:
+            values = array('d', [0.0]) * (size * (size - 1) // 2)
+        self.values = values
+
+    def index(self, row, col):
+        """
+        Returns the position of the cell *row*/*col* in :py:attr:`values`.
+        """
+        if row > col:
+            row, col = col, row
+        return self.size * row - row * (row + 1) // 2 + col - row - 1
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            row, col = key
+            if row == col:
+                return self.diagonal
+            return self.values[self.index(row, col)]
+        if not 0 <= key < self.size:
+            raise IndexError('row index out of range')
+        return _CondensedRow(self, key)
+
+    def __setitem__(self, key, value):
+        row, col = key
+        if row == col:
+            raise ValueError('The diagonal of a condensed matrix is constant')
+        self.values[self.index(row, col)] = value
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for row in range(self.size):
+            yield _CondensedRow(self, row)
+
+    def store_upper_row(self, row, cells):
+        """
+        Stores the cells of *row* to the right of the diagonal (the columns
+        ``row + 1`` to ``size - 1``) at once.
+        """
+        offset = self.index(row, row + 1)
+        self.values[offset:offset + len(cells)] = array('d', cells)
+
+
+#: The default number of rows and columns of the tiles of a
+#: :py:class:`MappedMatrix` (64 gives tiles of 32 KiB).
+DEFAULT_TILE_SIZE = 64
+
+
+class MappedMatrix(CondensedMatrix):
+    """
+    A :py:class:`CondensedMatrix` which is stored in a memory-mapped file
+    instead of memory, so it can be larger than the available memory. The
+    operating system loads the parts of the file which are in use and evicts
+    them as needed.
+
+    The cells above the diagonal are not stored row by row, but in square
+    tiles of *tile_size* rows and columns. Reading a complete row (or column)
+    of a row-by-row layout touches one page of the file per cell on one side
+    of the diagonal. With tiles, the cells of *tile_size* consecutive rows are
+    stored close to each other, so a row touches far less pages.
+
+    :param size: The number of rows (and columns).
+    :param diagonal: The value of the cells on the diagonal.
+    :param path: The file to store the matrix in. By default, an anonymous
+        temporary file is created (in the directory given by the ``TMPDIR``
+        environment variable), which is removed when the matrix is closed.
+    :param tile_size: The number of rows and columns of each tile.
+    """
+
+    def __init__(self, size, diagonal=0, path=None,
+                 tile_size=DEFAULT_TILE_SIZE):
+        if not hasattr(memoryview, 'cast'):
+            raise ValueError('Memory-mapped matrices require Python 3')
+        self.size = size
+        self.diagonal = diagonal
+        self.tile_size = tile_size
+        self.blocks = -(-size // tile_size)
+        length = max(1, self.blocks * (self.blocks + 1) // 2 *
+                     tile_size * tile_size)
+        if path is None:
+            self.file = tempfile.TemporaryFile()
+        else:
+            self.file = open(path, 'w+b')
+        # the file is sparse until cells are written
+        self.file.truncate(length * 8)
+        self.mmap = mmap.mmap(self.file.fileno(), length * 8)
+        self.values = _as_doubles(self.mmap)
+
+    def index(self, row, col):
+        """
+        Returns the position of the cell *row*/*col* in :py:attr:`values`.
+        """
+        if row > col:
+            row, col = col, row
+        tile = self.tile_size
+        block_row = row // tile
+        block_col = col // tile
+        # the tiles above the diagonal are numbered row by row
+        position = (self.blocks * block_row -
+                    block_row * (block_row - 1) // 2 + block_col - block_row)
+        return (position * tile + row % tile) * tile + col % tile
+
+    def store_upper_row(self, row, cells):
+        """
+        Stores the cells of *row* to the right of the diagonal (the columns
+        ``row + 1`` to ``size - 1``) at once, one tile at a time.
+        """
+        col = row + 1
+        while col < self.size:
+            stop = min(self.size, (col // self.tile_size + 1) *
+                       self.tile_size)
+            offset = self.index(row, col)
+            self.values[offset:offset + stop - col] = array(
+                'd', cells[col - row - 1:stop - row - 1])
+            col = stop
+
+    def flush(self):
+        """
+        Writes all changes to the file.
+        """
+        self.mmap.flush()
+
+    def close(self):
+        """
+        Unmaps and closes the file. The matrix cannot be used afterwards.
+        """
+        if self.mmap is None:
+            return
+        self.values.release()
+        self.values = None
+        self.mmap.close()
+        self.mmap = None
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class DistanceMatrix(object):
+    """
+    Precomputed distances between items, for example from a previous run or
+    from another system. Instances can be used as distance function: calling
+    ``matrix(a, b)`` looks up the distance between the items labelled *a* and
+    *b*. ``matrix[i, j]`` returns the distance between the items at the
+    positions *i* and *j*.
+
+    Example:
+
+        >>> matrix = DistanceMatrix([3, 5, 4], ['a', 'b', 'c'])
+        >>> matrix('a', 'c')
+        5
+        >>> matrix[1, 2]
+        4
+
+    :param distances: Either a square matrix (a list of lists, a 2D NumPy
+        array or a :py:class:`CondensedMatrix`), or a condensed matrix: a flat
+        sequence of the ``n * (n - 1) / 2`` cells above the diagonal, row by
+        row (the format of ``scipy.spatial.distance.pdist``). The name of a
+        ``.npy`` file is loaded memory-mapped, which requires NumPy. The
+        values are not copied.
+    :param labels: The items, in the order of the rows. They must be hashable
+        and unique. By default, the items are the positions ``0`` to
+        ``n - 1``.
+    """
+
+    def __init__(self, distances, labels=None):
+        if isinstance(distances, str):
+            if numpy is None:
+                raise ValueError('Loading .npy files requires NumPy')
+            distances = numpy.load(distances, mmap_mode='r')
+        packed = isinstance(distances, CondensedMatrix)
+        if packed:
+            square = False
+        elif hasattr(distances, 'ndim'):
+            square = distances.ndim == 2
+        else:
+            square = len(distances) > 0 and hasattr(distances[0], '__len__')
+        if square:
+            size = len(distances)
+            if any(len(row) != size for row in distances):
+                raise ValueError('A square distance matrix must have as many '
+                                 'columns as rows')
+        elif packed:
+            size = distances.size
+        else:
+            size = int(round((1 + sqrt(1 + 8 * len(distances))) / 2))
+            if not len(distances):
+                size = 0
+            elif size * (size - 1) // 2 != len(distances):
+                raise ValueError('A condensed distance matrix must contain '
+                                 'n * (n - 1) / 2 values')
+        if labels is None:
+            labels = range(size)
+        elif len(labels) != size:
+            raise ValueError('There must be one label for each row of the '
+                             'distance matrix')
+        self.distances = distances
+        #: Whether the values are a memory-mapped NumPy array.
+        self.mapped = numpy is not None and isinstance(distances,
+                                                       numpy.memmap)
+        self.packed = packed
+        self.square = square
+        self.size = size
+        self.labels = list(labels)
+        self.positions = dict((label, position)
+                              for position, label in enumerate(self.labels))
+        if len(self.positions) != size:
+            raise ValueError('The labels of a distance matrix must be unique')
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        if self.packed:
+            return self.distances[key]
+        row, col = key
+        if self.square:
+            return self.distances[row][col]
+        if row == col:
+            return 0
+        if row > col:
+            row, col = col, row
+        return self.distances[self.size * row - row * (row + 1) // 2 +
+                              col - row - 1]
+
+    def __call__(self, a, b):
+        return self[self.positions[a], self.positions[b]]
+
+    def values(self, rows, cols):
+        """
+        Returns the distances between each of the items at the positions
+        *rows* and each of the items at the positions *cols* as flat list.
+        """
+        if self.square:
+            if len(cols) == 1:
+                col = cols[0]
+                return [self.distances[row][col] for row in rows]
+            pick = itemgetter(*cols)
+            values = []
+            for row in rows:
+                values.extend(pick(self.distances[row]))
+            return values
+        return [self[row, col] for row in rows for col in cols]
+
+
+class _CondensedRow(object):
+    """
+    A view on one row of a :py:class:`CondensedMatrix`.
+    """
+
+    def __init__(self, matrix, row):
+        self.matrix = matrix
+        self.row = row
+
+    def __getitem__(self, col):
+        return self.matrix[self.row, col]
+
+    def __setitem__(self, col, value):
+        self.matrix[self.row, col] = value
+
+    def __len__(self):
+        return self.matrix.size
+
+    def __iter__(self):
+        for col in range(self.matrix.size):
+            yield self.matrix[self.row, col]
+
+
 class Matrix(object):
     """
     Object representation of the item-item matrix.
     """
 
-    def __init__(self, data, combinfunc, symmetric=False, diagonal=None):
+    def __init__(self, data, combinfunc, symmetric=False, diagonal=None,
+                 storage='list', executor='processes'):
         """
         Takes a list of data and generates a 2D-matrix using the supplied
         combination function to calculate the values.
@@ -80,29 +481,143 @@ class Matrix(object):
             functions, the diagonal will stay constant. An example could be the
             function ``x-y``. Then each diagonal cell will be ``0``.  If this
             value is set to None, then the diagonal will be calculated.
+        :param storage: How the generated matrix is stored. Either ``'list'``
+            (a list of lists), ``'condensed'`` (a :py:class:`CondensedMatrix`)
+            or ``'mapped'`` (a :py:class:`MappedMatrix` in a temporary file,
+            for matrices which do not fit into memory). Condensed and mapped
+            storage require a symmetric matrix with a constant diagonal and
+            numeric values.
+        :param executor: How the work is spread when more than one worker is
+            requested. ``'processes'`` (the default) uses worker processes.
+            ``'threads'`` uses a pool of threads, which avoids pickling and
+            works with any ``combinfunc``, but only runs in parallel if
+            ``combinfunc`` releases the GIL (as many NumPy or C-extension
+            functions do). ``'serial'`` always runs in the current thread.
         """
+        if storage not in STORAGES:
+            raise ValueError('storage must be one of list, condensed or '
+                             'mapped')
+        check_executor(executor)
+        if storage != 'list' and (not symmetric or diagonal is None):
+            raise ValueError('A condensed matrix must be symmetric and have '
+                             'a constant diagonal')
         self.data = data
         self.combinfunc = combinfunc
         self.symmetric = symmetric
         self.diagonal = diagonal
+        self.storage = storage
+        self.executor = executor
+        self.pool = None
+        self.num_workers = 0
+        self.buffer = None
+        self._items = None
+
+    def start_workers(self, num_processes):
+        """
+        Starts a pool of *num_processes* workers (processes or threads,
+        depending on the *executor* of this matrix). The data and the
+        combination function are handed to the workers only once, when they
+        start. The pool is reused by all following calls to
+        :py:meth:`genmatrix` until :py:meth:`stop_workers` is called.
+
+        For ``'condensed'`` storage, a shared memory buffer for the matrix is
+        allocated as well. The workers write the computed values directly into
+        that buffer, so only row ranges are sent back to this process. All
+        matrices generated with the same pool share that buffer.
+
+        A :py:class:`Matrix` can also be used as context manager, which stops
+        the workers on exit.
+        """
+        if self.pool is not None or self.executor == 'serial':
+            return
+        self.num_workers = num_processes
+        if self.executor == 'processes' and self.storage == 'condensed':
+            size = len(self.data)
+            self.buffer = RawArray('d', size * (size - 1) // 2)
+        self.pool = WorkerPool(self.executor, num_processes,
+                               _initialise_worker,
+                               (self.data, self.combinfunc, self.symmetric,
+                                self.diagonal, self.buffer))
+
+    def stop_workers(self):
+        """
+        Stops the worker processes started with :py:meth:`start_workers`.
+        """
+        if self.pool is None:
+            return
+        self.pool.close()
+        self.pool = None
+        self.num_workers = 0
+        self.buffer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop_workers()
+
+    def _row_blocks(self):
+        """
+        Splits the rows into blocks of consecutive rows which contain roughly
+        the same number of cells to compute. In a symmetric matrix, the first
+        rows contain more cells than the last ones. For ``'mapped'`` storage,
+        the blocks contain at most :py:data:`MAPPED_BLOCK_CELLS` cells (or a
+        single row), so the results sent back by the workers stay small
+        however large the matrix is.
+        """
+        size = len(self.data)
+        if self.symmetric:
+            cells = [size - row_index for row_index in range(size)]
+        else:
+            cells = [size] * size
+        target = max(1, sum(cells) // (self.num_workers * 8))
+        if self.storage == 'mapped':
+            target = min(target, MAPPED_BLOCK_CELLS)
+        blocks = []
+        start = accumulated = 0
+        for row_index, row_cells in enumerate(cells):
+            accumulated += row_cells
+            if accumulated >= target:
+                blocks.append((start, row_index + 1))
+                start = row_index + 1
+                accumulated = 0
+        if start < size:
+            blocks.append((start, size))
+        return blocks
 
-    def worker(self):
+    def _store_row(self, row_index, cells):
         """
-        Multiprocessing task function run by worker processes
+        Stores the cells computed by :py:func:`_compute_row` into the matrix.
         """
-        tasks_completed = 0
-        for task in iter(self.task_queue.get, 'STOP'):
-            col_index, item, item2 = task
-            if not hasattr(item, '__iter__') or isinstance(item, tuple):
-                item = [item]
-            if not hasattr(item2, '__iter__') or isinstance(item2, tuple):
-                item2 = [item2]
-            result = (col_index, self.combinfunc(item, item2))
-            self.done_queue.put(result)
-            tasks_completed += 1
-        logger.info("Worker %s performed %s tasks",
-                    current_process().name,
-                    tasks_completed)
+        if self.storage != 'list':
+            self.matrix.store_upper_row(row_index, cells[1:])
+        elif self.symmetric:
+            # fill in the "lower left triangle" from the previous rows
+            row = [self.matrix[col_index][row_index]
+                   for col_index in range(row_index)]
+            self.matrix.append(row + cells)
+        else:
+            self.matrix.append(cells)
+
+    def _allocate(self):
+        """
+        Creates the empty storage of :py:attr:`matrix`.
+        """
+        if self.storage == 'condensed':
+            values = None
+            if self.buffer is not None:
+                values = _as_doubles(self.buffer)
+            self.matrix = CondensedMatrix(len(self.data), self.diagonal,
+                                          values)
+            if self.pool is not None and self.pool.state is not None:
+                # worker threads write directly into the new matrix
+                self.pool.state['buffer'] = self.matrix.values
+        elif self.storage == 'mapped':
+            # The rows computed by worker processes are written by this
+            # process, in blocks of a bounded size (see _row_blocks).
+            self.matrix = MappedMatrix(len(self.data), self.diagonal)
+        else:
+            self.matrix = []
 
     def genmatrix(self, num_processes=1):
         """
@@ -111,92 +626,97 @@ class Matrix(object):
         :param num_processes: If you want to use multiprocessing to split up the
             work and run ``combinfunc()`` in parallel, specify
             ``num_processes > 1`` and this number of workers will be spun up,
-            the work is split up amongst them evenly.
+            the work is split up amongst them evenly. If workers have already
+            been started using :py:meth:`start_workers`, these are used
+            instead.
         """
-        use_multiprocessing = num_processes > 1
-        if use_multiprocessing:
-            self.task_queue = Queue()
-            self.done_queue = Queue()
-
-        self.matrix = []
         logger.info("Generating matrix for %s items - O(n^2)", len(self.data))
-        if use_multiprocessing:
-            logger.info("Using multiprocessing on %s processes!", num_processes)
 
-        if use_multiprocessing:
-            logger.info("Spinning up %s workers", num_processes)
-            processes = [Process(target=self.worker) for i in range(num_processes)]
-            [process.start() for process in processes]
+        stop_workers = False
+        if num_processes > 1 and self.pool is None:
+            self.start_workers(num_processes)
+            stop_workers = True
 
-        for row_index, item in enumerate(self.data):
-            logger.debug("Generating row %s/%s (%0.2f%%)",
-                         row_index,
-                         len(self.data),
-                         100.0 * row_index / len(self.data))
-            row = {}
-            if use_multiprocessing:
-                num_tasks_queued = num_tasks_completed = 0
-            for col_index, item2 in enumerate(self.data):
-                if self.diagonal is not None and col_index == row_index:
-                    # This is a cell on the diagonal
-                    row[col_index] = self.diagonal
-                elif self.symmetric and col_index < row_index:
-                    # The matrix is symmetric and we are "in the lower left
-                    # triangle" - fill this in after (in case of multiprocessing)
-                    pass
-                # Otherwise, this cell is not on the diagonal and we do indeed
-                # need to call combinfunc()
-                elif use_multiprocessing:
-                    # Add that thing to the task queue!
-                    self.task_queue.put((col_index, item, item2))
-                    num_tasks_queued += 1
-                    # Start grabbing the results as we go, so as not to stuff all of
-                    # the worker args into memory at once (as Queue.get() is a
-                    # blocking operation)
-                    if num_tasks_queued > num_processes:
-                        col_index, result = self.done_queue.get()
-                        row[col_index] = result
-                        num_tasks_completed += 1
-                else:
-                    # Otherwise do it here, in line
-                    """
-                    if not hasattr(item, '__iter__') or isinstance(item, tuple):
-                        item = [item]
-                    if not hasattr(item2, '__iter__') or isinstance(item2, tuple):
-                        item2 = [item2]
-                    """
-                    # See the comment in function _encapsulate_item_for_combinfunc
-                    # for details of why the lines above have been replaced
-                    # by function invocations
-                    item = _encapsulate_item_for_combinfunc(item)
-                    item2 = _encapsulate_item_for_combinfunc(item2)
-                    row[col_index] = self.combinfunc(item, item2)
+        self._allocate()
 
-            if self.symmetric:
-                # One more iteration to get symmetric lower left triangle
-                for col_index, item2 in enumerate(self.data):
-                    if col_index >= row_index:
-                        break
-                    # post-process symmetric "lower left triangle"
-                    row[col_index] = self.matrix[col_index][row_index]
-
-            if use_multiprocessing:
-                # Grab the remaining worker task results
-                while num_tasks_completed < num_tasks_queued:
-                    col_index, result = self.done_queue.get()
-                    row[col_index] = result
-                    num_tasks_completed += 1
-
-            row_indexed = [row[index] for index in range(len(self.data))]
-            self.matrix.append(row_indexed)
-
-        if use_multiprocessing:
-            logger.info("Stopping/joining %s workers", num_processes)
-            [self.task_queue.put('STOP') for i in range(num_processes)]
-            [process.join() for process in processes]
+        try:
+            if self.pool is not None and self.storage == 'condensed':
+                logger.info("Using %s workers (%s) with a shared buffer!",
+                            self.num_workers, self.executor)
+                for start, stop in self.pool.map(_fill_condensed,
+                                             self._row_blocks()):
+                    logger.debug("Generated rows %s-%s/%s",
+                                 start, stop, len(self.data))
+            elif self.pool is not None:
+                logger.info("Using %s workers (%s)!",
+                            self.num_workers, self.executor)
+                blocks = self.pool.map(_compute_rows, self._row_blocks())
+                for start, rows in blocks:
+                    logger.debug("Received rows %s-%s/%s",
+                                 start, start + len(rows), len(self.data))
+                    for row_index, cells in enumerate(rows, start):
+                        self._store_row(row_index, cells)
+            else:
+                # See the comment in function _encapsulate_item_for_combinfunc
+                # for details about the encapsulation of items.
+                items = [_encapsulate_item_for_combinfunc(item)
+                         for item in self.data]
+                for row_index in range(len(items)):
+                    logger.debug("Generating row %s/%s (%0.2f%%)",
+                                 row_index,
+                                 len(items),
+                                 100.0 * row_index / len(items))
+                    self._store_row(row_index, _compute_row(items,
+                                                            self.combinfunc,
+                                                            row_index,
+                                                            self.symmetric,
+                                                            self.diagonal))
+        finally:
+            if stop_workers:
+                self.stop_workers()
 
         logger.info("Matrix generated")
 
+    def loadmatrix(self, distances):
+        """
+        Fills the matrix with precomputed values instead of calling
+        ``combinfunc()``.
+
+        :param distances: A :py:class:`DistanceMatrix` containing all the
+            items of the data list as labels.
+        """
+        logger.info("Loading matrix for %s items", len(self.data))
+        self._allocate()
+        positions = [distances.positions[item] for item in self.data]
+        for row_index, position in enumerate(positions):
+            if self.symmetric:
+                columns = positions[row_index + 1:]
+                cells = [self.diagonal]
+            else:
+                columns = positions
+                cells = []
+            if columns:
+                cells.extend(distances.values([position], columns))
+            self._store_row(row_index, cells)
+        logger.info("Matrix loaded")
+
+    def combine_groups(self, groups, other_group):
+        """
+        Calls ``combinfunc()`` for each of the *groups* with *other_group*
+        in this process. A group is a sequence of indices into the data list,
+        and is passed to ``combinfunc()`` as list of the corresponding items.
+
+        :return: A list containing one result for each of *groups*.
+        """
+        if self._items is None:
+            self._items = [_encapsulate_item_for_combinfunc(item)
+                           for item in self.data]
+        items = self._items
+        other_items = _group_items(self.data, items, other_group)
+        return [self.combinfunc(_group_items(self.data, items, group),
+                                other_items)
+                for group in groups]
+
     def __str__(self):
         """
         Returns a 2-dimensional list of data as text-string which can be
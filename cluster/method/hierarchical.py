@@ -15,18 +15,38 @@
 # Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
 #
 
+from __future__ import division
 from functools import partial
+from heapq import heappop, heappush
 import logging
 
-from cluster.cluster import Cluster
-from cluster.matrix import Matrix
+from cluster.cluster import Cluster, LinkageTree
+from cluster.matrix import STORAGES, DistanceMatrix, Matrix
 from cluster.method.base import BaseClusterMethod
-from cluster.linkage import single, complete, average, uclus
+from cluster.linkage import (single, complete, average, uclus, ward,
+                             INDEX_LINKAGES, ItemLinkage, LinkageCache,
+                             SUMMED_LINKAGES, UPDATE_RULES)
+from cluster.workers import check_executor
 
 
 logger = logging.getLogger(__name__)
 
 
+class _ItemDistance(object):
+    """
+    The combination function of a :py:class:`~cluster.matrix.Matrix` of item
+    positions: returns the distance between the items at two positions (which
+    are wrapped in lists by the matrix).
+    """
+
+    def __init__(self, items, distance_function):
+        self.items = items
+        self.distance_function = distance_function
+
+    def __call__(self, a, b):
+        return self.distance_function(self.items[a[0]], self.items[b[0]])
+
+
 class HierarchicalClustering(BaseClusterMethod):
     """
     Implementation of the hierarchical clustering method as explained in a
@@ -57,32 +77,116 @@ class HierarchicalClustering(BaseClusterMethod):
     :param data: The collection of items to be clustered.
     :param distance_function: A function which takes two elements of ``data``
         and returns a distance between both elements (note that the distance
-        should not be returned as negative value!)
+        should not be returned as negative value!). If this is a
+        :py:class:`~cluster.matrix.DistanceMatrix`, its values are used
+        directly (see :py:meth:`from_distances`).
     :param linkage: The method used to determine the distance between two
         clusters. See :py:meth:`~.HierarchicalClustering.set_linkage_method` for
         possible values.
     :param num_processes: If you want to use multiprocessing to split up the
         work and run ``genmatrix()`` in parallel, specify num_processes > 1 and
         this number of workers will be spun up, the work split up amongst them
-        evenly.
+        evenly. The workers compute the distances between the items; the
+        merges (including the linkage values of new clusters) are computed in
+        the calling process.
     :param progress_callback: A function to be called on each iteration to
         publish the progress. The function is called with two integer arguments
         which represent the total number of elements in the cluster, and the
         remaining elements to be clustered.
+    :param storage: How the cluster-cluster matrix is kept in memory. Either
+        ``'list'``, ``'condensed'`` or ``'mapped'``. The condensed storage
+        only keeps one half of the matrix in a packed array of floats (see
+        :py:class:`~cluster.matrix.CondensedMatrix`) and is recommended for
+        large data sets. The mapped storage keeps the same values in a
+        temporary file (see :py:class:`~cluster.matrix.MappedMatrix`) for
+        matrices which do not fit into memory. Both require the linkage values
+        to be numeric. By default, ``'list'`` is used, unless the distances
+        are a :py:class:`~cluster.matrix.DistanceMatrix` of NumPy values
+        (``'condensed'``, or ``'mapped'`` for a memory-mapped ``.npy`` file).
+    :param linkage_cache_size: The maximum number of linkage values which are
+        remembered during one run of :py:meth:`~.HierarchicalClustering.cluster`
+        (see :py:class:`~cluster.linkage.LinkageCache`). ``None`` means
+        unlimited, ``0`` (the default) disables the cache. The merge loop
+        computes the linkage of each pair of clusters only once, so the cache
+        only helps custom linkage functions which look up the same values
+        repeatedly. The entries of a cluster are dropped when it is merged, and
+        all entries when the run is complete. The cache of the last run (with
+        its hit and miss counters) is available as :py:attr:`linkage_cache`.
+    :param executor: How the work is spread if *num_processes* is greater than
+        one. Either ``'processes'`` (the default), ``'threads'`` or
+        ``'serial'``. Threads are useful if the distance function releases the
+        GIL or cannot be pickled. See :py:class:`~cluster.matrix.Matrix`.
+    :param compact: If ``True``, the result is kept as
+        :py:class:`~cluster.cluster.LinkageTree` (an array of merge records)
+        instead of nested :py:class:`~cluster.cluster.Cluster` instances. This
+        needs much less memory for large data sets. The methods of this class
+        work the same in both cases.
     """
 
     def __init__(self, data, distance_function, linkage=None, num_processes=1,
-                 progress_callback=None):
+                 progress_callback=None, storage=None,
+                 linkage_cache_size=0, executor='processes',
+                 compact=False):
         if not linkage:
             linkage = single
+        if storage is None:
+            storage = 'list'
+            if (isinstance(distance_function, DistanceMatrix) and
+                    hasattr(distance_function.distances, 'ndim')):
+                # keep NumPy values out of Python lists (and memory-mapped
+                # values out of memory)
+                storage = 'mapped' if distance_function.mapped else 'condensed'
+        if storage not in STORAGES:
+            raise ValueError('storage must be one of list, condensed or '
+                             'mapped')
+        check_executor(executor)
         logger.info("Initializing HierarchicalClustering object with linkage "
                     "method %s", linkage)
         BaseClusterMethod.__init__(self, sorted(data), distance_function)
         self.set_linkage_method(linkage)
         self.num_processes = num_processes
         self.progress_callback = progress_callback
+        self.storage = storage
+        self.linkage_cache_size = linkage_cache_size
+        self.linkage_cache = None
+        self.executor = executor
+        self.compact = compact
+        self.linkage_tree = None
         self.__cluster_created = False
 
+    @classmethod
+    def from_distances(cls, distances, labels=None, linkage=None, **kwargs):
+        """
+        Creates an instance which clusters precomputed distances, without
+        calling a distance function to generate the item-item matrix.
+
+        Example:
+
+            >>> cl = HierarchicalClustering.from_distances(
+                    [[0, 2, 9], [2, 0, 8], [9, 8, 0]], ['a', 'b', 'c'])
+            >>> cl.getlevel(5)
+            [['c'], ['a', 'b']]
+
+        :param distances: A square or condensed matrix of distances, or the
+            name of a ``.npy`` file. See
+            :py:class:`~cluster.matrix.DistanceMatrix`. The distances are
+            copied once into the cluster-cluster matrix. For NumPy arrays, the
+            default *storage* of this copy is ``'condensed'``, and for
+            memory-mapped ``.npy`` files ``'mapped'``, so the values are not
+            turned into Python lists.
+        :param labels: The items, in the order of the rows of *distances*.
+            By default, the items are the row numbers.
+        :param linkage: See :py:meth:`set_linkage_method`. Custom linkage
+            functions receive the labels, and the distance function looks up
+            their distance in *distances*.
+        :param kwargs: The other arguments of
+            :py:class:`HierarchicalClustering`.
+        """
+        distances = DistanceMatrix(distances, labels)
+        if linkage is not None:
+            kwargs['linkage'] = linkage
+        return cls(distances.labels, distances, **kwargs)
+
     def publish_progress(self, total, current):
         """
         If a progress function was supplied, this will call that function with
@@ -99,9 +203,13 @@ class HierarchicalClustering(BaseClusterMethod):
         Sets the method to determine the distance between two clusters.
 
         :param method: The method to use. It can be one of ``'single'``,
-            ``'complete'``, ``'average'`` or ``'uclus'``, or a callable. The
-            callable should take two collections as parameters and return a
-            distance value between both collections.
+            ``'complete'``, ``'average'``, ``'uclus'`` or ``'ward'``, or a
+            callable. Ward's method (see :py:func:`~cluster.linkage.ward`)
+            requires the euclidean distance between numeric vectors. The
+            callable should take two lists of items and a distance function
+            as parameters and return a distance value between both lists. The
+            distance function it receives looks up the precomputed distances
+            (see :py:class:`~cluster.linkage.ItemLinkage`).
         """
         if method == 'single':
             self.linkage = single
@@ -111,83 +219,244 @@ class HierarchicalClustering(BaseClusterMethod):
             self.linkage = average
         elif method == 'uclus':
             self.linkage = uclus
+        elif method == 'ward':
+            self.linkage = ward
         elif hasattr(method, '__call__'):
             self.linkage = method
         else:
             raise ValueError('distance method must be one of single, '
-                             'complete, average of uclus')
+                             'complete, average, uclus or ward')
 
     def cluster(self, matrix=None, level=None, sequence=None):
         """
         Perform hierarchical clustering.
 
-        :param matrix: The 2D list that is currently under processing. The
-            matrix contains the distances of each item with each other
-        :param level: The current level of clustering
-        :param sequence: The sequence number of the clustering
+        The item-item matrix is generated only once, calling the distance
+        function exactly once for each pair of items. After each merge, only
+        the distances between the newly created cluster and the remaining
+        clusters are determined. For the built-in ``'single'``, ``'complete'``,
+        ``'average'`` and ``'ward'`` linkages this is done using the
+        Lance-Williams update rules (see
+        :py:data:`cluster.linkage.UPDATE_RULES`). Other linkage methods are
+        recomputed by looking up the item-item distances (see
+        :py:data:`cluster.linkage.INDEX_LINKAGES`).
+
+        The merges are recorded in :py:attr:`linkage_tree` (a
+        :py:class:`~cluster.cluster.LinkageTree`).
+
+        :param matrix: Unused. Kept for backwards compatibility.
+        :param level: Unused. Kept for backwards compatibility.
+        :param sequence: Unused. Kept for backwards compatibility.
         """
         logger.info("Performing cluster()")
 
-        if matrix is None:
-            # create level 0, first iteration (sequence)
-            level = 0
-            sequence = 0
-            matrix = []
-
-        # if the matrix only has two rows left, we are done
-        linkage = partial(self.linkage, distance_function=self.distance)
         initial_element_count = len(self._data)
-        while len(matrix) > 2 or matrix == []:
-
-            item_item_matrix = Matrix(self._data,
-                                      linkage,
-                                      True,
-                                      0)
-            item_item_matrix.genmatrix(self.num_processes)
-            matrix = item_item_matrix.matrix
-
-            smallestpair = None
-            mindistance = None
-            rowindex = 0  # keep track of where we are in the matrix
-            # find the minimum distance
-            for row in matrix:
-                cellindex = 0  # keep track of where we are in the matrix
-                for cell in row:
-                    # if we are not on the diagonal (which is always 0)
-                    # and if this cell represents a new minimum...
-                    cell_lt_mdist = cell < mindistance if mindistance else False
-                    if ((rowindex != cellindex) and
-                            (cell_lt_mdist or smallestpair is None)):
-                        smallestpair = (rowindex, cellindex)
-                        mindistance = cell
-                    cellindex += 1
-                rowindex += 1
-
-            sequence += 1
-            level = matrix[smallestpair[1]][smallestpair[0]]
-            cluster = Cluster(level, self._data[smallestpair[0]],
-                              self._data[smallestpair[1]])
-
-            # maintain the data, by combining the the two most similar items
-            # in the list we use the min and max functions to ensure the
-            # integrity of the data.  imagine: if we first remove the item
-            # with the smaller index, all the rest of the items shift down by
-            # one. So the next index will be wrong. We could simply adjust the
-            # value of the second "remove" call, but we don't know the order
-            # in which they come. The max and min approach clarifies that
-            self._data.remove(self._data[max(smallestpair[0],
-                                             smallestpair[1])])  # remove item 1
-            self._data.remove(self._data[min(smallestpair[0],
-                                             smallestpair[1])])  # remove item 2
-            self._data.append(cluster)  # append item 1 and 2 combined
-
-            self.publish_progress(initial_element_count, len(self._data))
+        if initial_element_count < 2:
+            # nothing to merge
+            self.__cluster_created = True
+            return
 
         # all the data is in one single cluster. We return that and stop
+        self._data[:] = [self._merge()]
         self.__cluster_created = True
         logger.info("Call to cluster() is complete")
         return
 
+    def _merge(self):
+        """
+        Computes all the merges of :py:meth:`cluster`, and returns the
+        top-level cluster (or the :py:class:`~cluster.cluster.LinkageTree` if
+        *compact* is set).
+        """
+        initial_element_count = len(self._data)
+        self.linkage_cache = LinkageCache(self.linkage_cache_size)
+
+        # The distances between the items are computed only once. Linkage
+        # methods with an update rule start from these distances, the other
+        # ones look them up (see cluster.linkage.INDEX_LINKAGES).
+        item_item_matrix = leaf_matrix = self._leaf_matrix()
+        try:
+            if self.linkage not in UPDATE_RULES:
+                leaves = DistanceMatrix(leaf_matrix.matrix)
+                index_linkage = INDEX_LINKAGES.get(self.linkage)
+                if index_linkage is None:
+                    index_linkage = ItemLinkage(self.linkage, self._data,
+                                                self.distance)
+                linkage = partial(self.linkage_cache, index_linkage,
+                                  distance_function=leaves)
+                item_item_matrix = Matrix(list(range(initial_element_count)),
+                                          linkage, True, 0, self.storage,
+                                          'serial')
+                if self.linkage in INDEX_LINKAGES:
+                    # for two single items, the built-in linkages are equal
+                    # to the distance between the items
+                    item_item_matrix.loadmatrix(leaves)
+                else:
+                    item_item_matrix.genmatrix()
+            root = self._agglomerate(item_item_matrix)
+        finally:
+            self.linkage_cache.clear(counters=False)
+            if self.storage == 'mapped':
+                leaf_matrix.matrix.close()
+                if item_item_matrix is not leaf_matrix:
+                    item_item_matrix.matrix.close()
+
+        logger.info("Linkage cache: %s hits, %s misses",
+                    self.linkage_cache.hits, self.linkage_cache.misses)
+        return root
+
+    def _leaf_matrix(self):
+        """
+        Returns a :py:class:`~cluster.matrix.Matrix` of the distances between
+        the items of the data list. The distance function is called exactly
+        once for each pair of items.
+        """
+        if isinstance(self.distance, DistanceMatrix):
+            matrix = Matrix(self._data, None, True, 0, self.storage)
+            matrix.loadmatrix(self.distance)
+            return matrix
+        matrix = Matrix(list(range(len(self._data))),
+                        _ItemDistance(self._data, self.distance), True, 0,
+                        self.storage, self.executor)
+        matrix.genmatrix(self.num_processes)
+        return matrix
+
+    def _agglomerate(self, item_item_matrix):
+        """
+        Runs the merge loop of :py:meth:`cluster` on the generated
+        *item_item_matrix*, and returns the top-level cluster (or the
+        :py:class:`~cluster.cluster.LinkageTree` if *compact* is set).
+        Without update rule, the items of *item_item_matrix* are the positions
+        of the items in the data list.
+        """
+        initial_element_count = len(self._data)
+        update_rule = UPDATE_RULES.get(self.linkage)
+        summed = self.linkage in SUMMED_LINKAGES
+        matrix = item_item_matrix.matrix
+
+        # Each item occupies a "slot" in the matrix. When two clusters are
+        # merged, the new cluster takes over the slot of the first one and the
+        # slot of the second one is abandoned.
+        tree = LinkageTree(self._data)
+        self.linkage_tree = tree
+        node_ids = list(range(initial_element_count))
+        nodes = None if self.compact else list(self._data)
+        sizes = [1] * initial_element_count
+        if not update_rule:
+            # The indices of the items contained in each slot
+            members = [[index] for index in range(initial_element_count)]
+
+        # The slots which are still in play. They are kept in the same order
+        # as the items in the data list of previous releases (merged clusters
+        # are appended at the end), so that pairs with equal distances are
+        # merged in the same order as before. ``order`` contains the sort-key
+        # of each slot.
+        active = list(range(initial_element_count))
+        order = list(range(initial_element_count))
+        next_order = initial_element_count
+
+        def cell(row_slot, col_slot):
+            value = matrix[row_slot][col_slot]
+            if summed:
+                value = value / (sizes[row_slot] * sizes[col_slot])
+            return value
+
+        # For each slot, we keep track of its nearest neighbour among the slots
+        # which come *after* it. The row minima are kept in a heap. Entries
+        # are not removed from the heap when they become outdated, but skipped
+        # once they pop up.
+        nearest = [None] * initial_element_count
+        mindistance = [None] * initial_element_count
+        heap = []
+
+        def find_nearest(row_slot):
+            nearest[row_slot] = mindistance[row_slot] = None
+            row = matrix[row_slot]
+            for col_slot in active[active.index(row_slot) + 1:]:
+                value = row[col_slot]
+                if summed:
+                    value = value / (sizes[row_slot] * sizes[col_slot])
+                if nearest[row_slot] is None or value < mindistance[row_slot]:
+                    nearest[row_slot] = col_slot
+                    mindistance[row_slot] = value
+            if nearest[row_slot] is not None:
+                push(row_slot)
+
+        def push(row_slot):
+            col_slot = nearest[row_slot]
+            heappush(heap, (mindistance[row_slot], order[row_slot],
+                            order[col_slot], row_slot, col_slot))
+
+        for row_slot in active:
+            find_nearest(row_slot)
+
+        while len(active) > 1:
+
+            # find the minimum distance
+            while True:
+                level, row_order, col_order, left, right = heappop(heap)
+                if (order[left] == row_order and
+                        order[right] == col_order and
+                        nearest[left] == right and
+                        mindistance[left] == level):
+                    break
+
+            node_ids[left] = tree.add(node_ids[left], node_ids[right], level)
+            node_ids[right] = None
+            if nodes is not None:
+                cluster = Cluster(level, nodes[left], nodes[right])
+
+            active.remove(left)
+            active.remove(right)
+            if update_rule:
+                distances = [update_rule(matrix[slot][left],
+                                         matrix[slot][right],
+                                         matrix[left][right],
+                                         sizes[left],
+                                         sizes[right],
+                                         sizes[slot])
+                             for slot in active]
+            else:
+                # merged clusters are never looked up again
+                self.linkage_cache.discard(members[left])
+                self.linkage_cache.discard(members[right])
+                members[left] = members[left] + members[right]
+                members[right] = None
+                distances = item_item_matrix.combine_groups(
+                    [members[slot] for slot in active], members[left])
+            for slot, distance in zip(active, distances):
+                matrix[slot][left] = matrix[left][slot] = distance
+
+            if nodes is not None:
+                nodes[left] = cluster
+                nodes[right] = None
+            sizes[left] += sizes[right]
+            order[left] = next_order
+            order[right] = None
+            next_order += 1
+            active.append(left)
+
+            # The new cluster comes last, so it has no row minimum of its own.
+            # Rows pointing to one of the merged clusters (or to nothing at all)
+            # need to be searched again. All other rows only need to check the
+            # new cluster.
+            for slot in active[:-1]:
+                if nearest[slot] in (left, right, None):
+                    find_nearest(slot)
+                else:
+                    value = cell(slot, left)
+                    if value < mindistance[slot]:
+                        nearest[slot] = left
+                        mindistance[slot] = value
+                        push(slot)
+            nearest[left] = mindistance[left] = None
+
+            self.publish_progress(initial_element_count, len(active))
+
+        if nodes is None:
+            return tree
+        return nodes[active[0]]
+
     def getlevel(self, threshold):
         """
         Returns all clusters with a maximum distance of *threshold* in between
@@ -208,6 +477,40 @@ class HierarchicalClustering(BaseClusterMethod):
 
         return self._data[0].getlevel(threshold)
 
+    def getlevels(self, thresholds):
+        """
+        Returns the result of :py:meth:`getlevel` for each of *thresholds*.
+        This is much faster than calling :py:meth:`getlevel` repeatedly.
+
+        :param thresholds: a sequence of thresholds.
+
+        See :py:meth:`~cluster.cluster.LinkageTree.getlevels`
+        """
+        if len(self._input) <= 1:
+            return [self._input for _ in thresholds]
+
+        if not self.__cluster_created:
+            self.cluster()
+
+        return self.linkage_tree.getlevels(thresholds)
+
+    def cut_k(self, k):
+        """
+        Returns exactly *k* clusters, by undoing the ``k - 1`` merges with the
+        highest levels.
+
+        :param k: the number of clusters.
+
+        See :py:meth:`~cluster.cluster.LinkageTree.cut_k`
+        """
+        if len(self._input) <= 1:
+            return self._input
+
+        if not self.__cluster_created:
+            self.cluster()
+
+        return self.linkage_tree.cut_k(k)
+
     def display(self):
         """
         Prints a simple dendogram-like representation of the full cluster
@@ -218,3 +521,115 @@ class HierarchicalClustering(BaseClusterMethod):
             self.cluster()
 
         self._data[0].display()
+
+
+class SingleLinkageClustering(HierarchicalClustering):
+    """
+    Hierarchical clustering with single linkage, computed from a minimum
+    spanning tree of the items (using Prim's algorithm) instead of an
+    item-item matrix. This takes ``O(n^2)`` time like the matrix, but only
+    ``O(n)`` memory, and the distance function is called exactly once for each
+    pair of items.
+
+    The result has the same levels as :py:class:`HierarchicalClustering` with
+    ``linkage='single'``. Only clusters merged at equal levels may be merged in
+    a different order.
+
+    Example:
+
+        >>> from cluster import SingleLinkageClustering
+        >>> cl = SingleLinkageClustering([123,334,345,242,234,1,3],
+                lambda x,y: float(abs(x-y)))
+        >>> cl.getlevel(90)
+        [[1, 3], [123], [234, 242], [334, 345]]
+
+    :param data: The collection of items to be clustered.
+    :param distance_function: A function which takes two elements of ``data``
+        and returns a distance between both elements, or a
+        :py:class:`~cluster.matrix.DistanceMatrix` (see
+        :py:meth:`~HierarchicalClustering.from_distances`).
+    :param progress_callback: A function to be called with the total number of
+        elements and the number of elements which are not yet part of the
+        spanning tree.
+    :param compact: If ``True``, the result is kept as
+        :py:class:`~cluster.cluster.LinkageTree`. See
+        :py:class:`HierarchicalClustering`.
+    """
+
+    def __init__(self, data, distance_function, progress_callback=None,
+                 compact=False):
+        HierarchicalClustering.__init__(self, data, distance_function,
+                                        'single',
+                                        progress_callback=progress_callback,
+                                        compact=compact)
+
+    def _spanning_tree(self):
+        """
+        Returns the edges of a minimum spanning tree of the items as
+        ``(first, second, distance)`` tuples, where *first* and *second* are
+        positions in the data list.
+        """
+        items = self._data
+        count = len(items)
+        # The positions of the items which are not yet part of the tree. For
+        # each of them, the distance to the closest item of the tree and the
+        # position of that item are kept.
+        remaining = list(range(1, count))
+        distances = [None] * count
+        closest = [0] * count
+        edges = []
+        current = 0
+        while remaining:
+            item = items[current]
+            best = None
+            for index, position in enumerate(remaining):
+                distance = self.distance(item, items[position])
+                if (distances[position] is None or
+                        distance < distances[position]):
+                    distances[position] = distance
+                    closest[position] = current
+                if best is None or (distances[position] <
+                                    distances[remaining[best]]):
+                    best = index
+            current = remaining.pop(best)
+            edges.append((closest[current], current, distances[current]))
+            self.publish_progress(count, len(remaining))
+        return edges
+
+    def _merge(self):
+        """
+        Merges the clusters along the edges of the minimum spanning tree, in
+        order of their distance (Kruskal's algorithm).
+        """
+        count = len(self._data)
+        tree = LinkageTree(self._data)
+        self.linkage_tree = tree
+        # Each cluster is represented by one of its items (using a union-find
+        # structure). Like in HierarchicalClustering, the older cluster of a
+        # merge becomes the left one.
+        parent = list(range(count))
+        node_ids = list(range(count))
+        order = list(range(count))
+        nodes = None if self.compact else list(self._data)
+
+        def find(position):
+            while parent[position] != position:
+                parent[position] = parent[parent[position]]
+                position = parent[position]
+            return position
+
+        edges = self._spanning_tree()
+        edges.sort(key=lambda edge: edge[2])
+        for next_order, (first, second, level) in enumerate(edges, count):
+            left, right = find(first), find(second)
+            if order[left] > order[right]:
+                left, right = right, left
+            node_ids[left] = tree.add(node_ids[left], node_ids[right], level)
+            if nodes is not None:
+                nodes[left] = Cluster(level, nodes[left], nodes[right])
+                nodes[right] = None
+            parent[right] = left
+            order[left] = next_order
+        if nodes is None:
+            return tree
+        return nodes[find(0)]
@@ -0,0 +1,276 @@
+#
+# This is part of "python-cluster". A library to group similar items together.
+# Copyright (C) 2006    Michel Albert
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation; either version 2.1 of the License, or (at your
+# option) any later version.
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License
+# for more details.
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+#
+"""
+Spatial indices for nearest neighbour queries.
+
+Both indices answer the same queries as a brute-force search over all points,
+including the order of points with equal distances (the lower index wins), but
+skip most of the distance calculations:
+
+* :py:class:`KDTree` splits the space along the coordinate axes. It works for
+  numeric tuples (or NumPy arrays) with the minkowski distance and is best
+  suited for a low number of dimensions.
+* :py:class:`BallTree` groups the points into nested balls. It works with any
+  distance function which is a metric (i.e. satisfies the triangle
+  inequality).
+
+Example:
+
+    >>> from cluster.spatial import KDTree
+    >>> tree = KDTree([(1, 1), (5, 3), (9, 9)])
+    >>> tree.nearest((4, 4))
+    (1, 1.4142135623730951)
+"""
+
+from heapq import heappush, heapreplace
+
+from .util import minkowski_distance
+
+#: The maximum number of points in the leaves of the trees.
+LEAF_SIZE = 16
+
+#: The relative margin by which a bound must exceed a distance before a node is
+#: skipped. The bounds are subject to rounding errors, so without this margin
+#: points with equal distances could be missed.
+ROUNDING_MARGIN = 1e-9
+
+
+class _Neighbours(object):
+    """
+    Collects the *k* closest ``(distance, index)`` pairs. The pairs are kept
+    in a heap with the worst one on top (using negated values).
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self.heap = []
+
+    def add(self, distance, index):
+        entry = (-distance, -index)
+        if len(self.heap) < self.k:
+            heappush(self.heap, entry)
+        elif entry > self.heap[0]:
+            heapreplace(self.heap, entry)
+
+    def worst(self):
+        """
+        Returns the distance which a point has to beat (or tie) to be added.
+        """
+        if len(self.heap) < self.k:
+            return None
+        return -self.heap[0][0]
+
+    def result(self):
+        return sorted((-distance, -index) for distance, index in self.heap)
+
+
+class _Tree(object):
+    """
+    The common parts of :py:class:`KDTree` and :py:class:`BallTree`. The nodes
+    are kept in flat lists. Each node covers the range ``start:end`` of
+    :py:attr:`order` (the indices of the points), and has either two children
+    or none (a leaf).
+    """
+
+    def __init__(self, points):
+        self.points = list(points)
+        self.order = list(range(len(self.points)))
+        self.start = []
+        self.end = []
+        self.children = []
+        if self.points:
+            self._build()
+
+    def __len__(self):
+        return len(self.points)
+
+    def _add_node(self, start, end):
+        self.start.append(start)
+        self.end.append(end)
+        self.children.append(None)
+        return len(self.start) - 1
+
+    def _build(self):
+        pending = [self._add_node(0, len(self.points))]
+        while pending:
+            node = pending.pop()
+            start, end = self.start[node], self.end[node]
+            if end - start <= LEAF_SIZE:
+                continue
+            middle = self._split(node, start, end)
+            if middle is None:
+                # the points cannot be split (they are all equal)
+                continue
+            left = self._add_node(start, middle)
+            right = self._add_node(middle, end)
+            self.children[node] = (left, right)
+            pending.extend((left, right))
+
+    def nearest(self, point):
+        """
+        Returns the index of the point closest to *point*, and its distance.
+        If several points are equally close, the one with the lowest index is
+        returned.
+        """
+        distance, index = self.query(point, 1)[0]
+        return index, distance
+
+    def query(self, point, k=1):
+        """
+        Returns the *k* points closest to *point* as a list of ``(distance,
+        index)`` tuples, closest first. Points with equal distances are
+        ordered by their index.
+        """
+        if not self.points:
+            return []
+        neighbours = _Neighbours(k)
+        stack = [(self._bound(node=0, point=point), 0)]
+        while stack:
+            bound, node = stack.pop()
+            worst = neighbours.worst()
+            if worst is not None and bound > worst * (1 + ROUNDING_MARGIN):
+                continue
+            if self.children[node] is None:
+                for index in self.order[self.start[node]:self.end[node]]:
+                    neighbours.add(self.distance(point, self.points[index]),
+                                   index)
+                continue
+            # visit the closer child first
+            children = sorted(((self._bound(child, point), child)
+                               for child in self.children[node]),
+                              reverse=True)
+            stack.extend(children)
+        return neighbours.result()
+
+
+class KDTree(_Tree):
+    """
+    A k-d tree over a list of numeric tuples (or a 2D NumPy array), using the
+    minkowski distance of order *p* (see
+    :py:func:`~cluster.util.minkowski_distance`).
+
+    :param points: The points to index.
+    :param p: The order of the minkowski distance.
+    """
+
+    def __init__(self, points, p=2):
+        self.p = p
+        self.lower = []
+        self.upper = []
+        _Tree.__init__(self, points)
+
+    def distance(self, x, y):
+        return minkowski_distance(x, y, self.p)
+
+    def _add_node(self, start, end):
+        # the bounding box of the node's points
+        coordinates = list(zip(*[self.points[index]
+                                 for index in self.order[start:end]]))
+        self.lower.append([min(values) for values in coordinates])
+        self.upper.append([max(values) for values in coordinates])
+        return _Tree._add_node(self, start, end)
+
+    def _split(self, node, start, end):
+        spreads = [high - low for low, high in zip(self.lower[node],
+                                                   self.upper[node])]
+        axis = max(range(len(spreads)), key=spreads.__getitem__)
+        if not spreads[axis]:
+            return None
+        self.order[start:end] = sorted(
+            self.order[start:end], key=lambda index: self.points[index][axis])
+        return (start + end) // 2
+
+    def _bound(self, node, point):
+        """
+        Returns the smallest possible distance between *point* and the
+        bounding box of *node*.
+        """
+        gaps = [max(low - value, value - high, 0)
+                for value, low, high in zip(point, self.lower[node],
+                                            self.upper[node])]
+        return sum(gap ** self.p for gap in gaps) ** (1.0 / self.p)
+
+
+class BallTree(_Tree):
+    """
+    A ball tree over a list of items, using *distance*, which must be a
+    metric. Each node is a ball around one of its points, containing all the
+    points of the node.
+
+    :param points: The items to index.
+    :param distance: A function returning the distance between two items. By
+        default, :py:func:`~cluster.util.minkowski_distance` is used.
+    """
+
+    def __init__(self, points, distance=None):
+        self.distance = distance or minkowski_distance
+        self.center = []
+        self.radius = []
+        _Tree.__init__(self, points)
+
+    def _add_node(self, start, end):
+        indices = self.order[start:end]
+        center = self.points[indices[0]]
+        self.center.append(center)
+        self.radius.append(max(self.distance(center, self.points[index])
+                               for index in indices))
+        return _Tree._add_node(self, start, end)
+
+    def _split(self, node, start, end):
+        if not self.radius[node]:
+            return None
+        # Two points far apart become the pivots of the children. Each point
+        # joins the closer pivot.
+        indices = self.order[start:end]
+        center = self.center[node]
+        first = max(indices, key=lambda index: self.distance(
+            center, self.points[index]))
+        second = max(indices, key=lambda index: self.distance(
+            self.points[first], self.points[index]))
+        left, right = [], []
+        for index in indices:
+            point = self.points[index]
+            if (self.distance(self.points[first], point) <=
+                    self.distance(self.points[second], point)):
+                left.append(index)
+            else:
+                right.append(index)
+        if not left or not right:
+            return None
+        # the pivots become the centers of the children
+        left.remove(first)
+        right.remove(second)
+        self.order[start:end] = [first] + left + [second] + right
+        return start + len(left) + 1
+
+    def _bound(self, node, point):
+        """
+        Returns the smallest possible distance between *point* and the points
+        of *node*.
+        """
+        return max(self.distance(point, self.center[node]) -
+                   self.radius[node], 0)
+
+
+def build_index(points, distance=None):
+    """
+    Returns a :py:class:`KDTree` for the default (minkowski) *distance*, and a
+    :py:class:`BallTree` otherwise.
+    """
+    if distance is None or distance is minkowski_distance:
+        return KDTree(points)
+    return BallTree(points, distance)
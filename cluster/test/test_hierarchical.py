@@ -27,10 +27,22 @@ Tests for hierarchical clustering.
 
 from difflib import SequenceMatcher
 from math import sqrt
+import os
+import shutil
 from sys import hexversion
+import tempfile
 import unittest
 
-from cluster import HierarchicalClustering
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from cluster import HierarchicalClustering, SingleLinkageClustering
+from cluster import workers
+from cluster.cluster import Cluster, LinkageTree
+from cluster.linkage import complete, single, ward
+from cluster.util import flatten, fullyflatten, minkowski_distance
 
 
 class Py23TestCase(unittest.TestCase):
@@ -161,6 +173,175 @@ class HClusterIntegerTestCase(Py23TestCase):
         [new_data.extend(_) for _ in cl.getlevel(40)]
         self.assertEqual(sorted(new_data), sorted(self.__data))
 
+    def testDistanceCalls(self):
+        """
+        The item-item distances should only be calculated once when using a
+        linkage with update rules.
+        """
+        calls = []
+
+        def distance(x, y):
+            calls.append((x, y))
+            return abs(x - y)
+
+        data = [item + 0.5 for item in set(self.__data)]
+        cl = HierarchicalClustering(data, distance, linkage='average')
+        cl.cluster()
+        self.assertEqual(len(calls), len(data) * (len(data) - 1) // 2)
+
+    def testDistanceCallsUclus(self):
+        """
+        Linkages without update rules look up the item-item distances, so
+        these are only calculated once as well.
+        """
+        calls = []
+
+        def distance(x, y):
+            calls.append((x, y))
+            return abs(x - y)
+
+        def linkage(a, b, distance_function):
+            return max(distance_function(x, y) for x in a for y in b)
+
+        data = sorted(set(self.__data))
+        for method in ('uclus', linkage):
+            del calls[:]
+            cl = HierarchicalClustering(data, distance, linkage=method)
+            cl.cluster()
+            self.assertEqual(len(calls), len(data) * (len(data) - 1) // 2)
+
+    def testVectorLinkages(self):
+        """
+        Single and complete linkage compare all pairs of items, not only the
+        smallest and largest item of each cluster (which is only correct for
+        numbers).
+        """
+        data = [(0.84, 0.76), (0.42, 0.26), (0.51, 0.4), (0.78, 0.3),
+                (0.48, 0.58), (0.91, 0.5), (0.28, 0.76), (0.62, 0.25),
+                (0.91, 0.98), (0.81, 0.9)]
+        for name, linkage in (('single', single), ('complete', complete)):
+            cl = HierarchicalClustering(data, minkowski_distance,
+                                        linkage=name, compact=True)
+            cl.cluster()
+            tree = cl.linkage_tree
+            for left, right, level, _ in tree.merges:
+                left_items = [tree.leaves[leaf]
+                              for leaf in tree.leaf_order(left)]
+                right_items = [tree.leaves[leaf]
+                               for leaf in tree.leaf_order(right)]
+                self.assertAlmostEqual(level, linkage(left_items,
+                                                      right_items,
+                                                      minkowski_distance))
+        cl = HierarchicalClustering(data, minkowski_distance)
+        cl.cluster()
+        self.assertAlmostEqual(cl.data[0].level, 0.0725 ** 0.5)
+
+    def testWardLinkage(self):
+        data = [(0, 0), (0, 1), (5, 5), (5, 6), (20, 20)]
+        for storage in ('list', 'condensed'):
+            cl = HierarchicalClustering(data, minkowski_distance,
+                                        linkage='ward', storage=storage)
+            self.assertEqual(sorted(sorted(cluster)
+                                    for cluster in cl.getlevel(5)),
+                             [[(0, 0), (0, 1)], [(5, 5), (5, 6)],
+                              [(20, 20)]])
+            root = cl.data[0]
+            self.assertAlmostEqual(root.level,
+                                   ward(data[:4], data[4:],
+                                        minkowski_distance))
+            merged = [item for item in root.items
+                      if isinstance(item, Cluster)][0]
+            self.assertAlmostEqual(merged.level, 10)
+
+    def testCentroidLinkage(self):
+        """
+        Custom linkages can compute distances between values which are not
+        items (like centroids).
+        """
+        def linkage(a, b, distance_function):
+            return distance_function(sum(a) / len(a), sum(b) / len(b))
+
+        cl = HierarchicalClustering([4.0, 1.0, 10.0, 2.0, 11.0],
+                                    lambda x, y: abs(x - y), linkage=linkage)
+        self.assertCItemsEqual([sorted(cluster)
+                                for cluster in cl.getlevel(3)],
+                               [[1.0, 2.0, 4.0], [10.0, 11.0]])
+
+    def testLinkageCache(self):
+        data = sorted(set(self.__data))
+        cl = HierarchicalClustering(data, lambda x, y: abs(x - y),
+                                    linkage='uclus', linkage_cache_size=None)
+        cl.cluster()
+        self.assertEqual(cl.linkage_cache.hits, 0)
+        # one linkage value for each new cluster and each remaining cluster
+        self.assertEqual(cl.linkage_cache.misses,
+                         (len(data) - 1) * (len(data) - 2) // 2)
+        self.assertEqual(len(cl.linkage_cache), 0)
+
+    def testCondensedStorage(self):
+        for linkage in ('single', 'complete', 'average', 'uclus'):
+            cl = HierarchicalClustering(self.__data, lambda x, y: abs(x - y),
+                                        linkage=linkage)
+            condensed = HierarchicalClustering(self.__data,
+                                               lambda x, y: abs(x - y),
+                                               linkage=linkage,
+                                               storage='condensed')
+            self.assertEqual(condensed.getlevel(40), cl.getlevel(40))
+            self.assertEqual(condensed.topo(), cl.topo())
+
+    @unittest.skipUnless(hasattr(memoryview, 'cast'),
+                         'Memory-mapped matrices require Python 3')
+    def testMappedStorage(self):
+        for linkage in ('single', 'complete', 'average', 'uclus'):
+            cl = HierarchicalClustering(self.__data, lambda x, y: abs(x - y),
+                                        linkage=linkage, storage='condensed')
+            mapped = HierarchicalClustering(self.__data,
+                                            lambda x, y: abs(x - y),
+                                            linkage=linkage, storage='mapped')
+            self.assertEqual(mapped.getlevel(40), cl.getlevel(40))
+            self.assertEqual(mapped.topo(), cl.topo())
+
+    def testFromDistances(self):
+        data = sorted(set(self.__data))
+        square = [[abs(x - y) for y in data] for x in data]
+        condensed = [abs(data[i] - data[j])
+                     for i in range(len(data))
+                     for j in range(i + 1, len(data))]
+        for linkage in ('single', 'complete', 'average', 'uclus'):
+            cl = HierarchicalClustering(data, lambda x, y: abs(x - y),
+                                        linkage=linkage)
+            for distances in (square, condensed):
+                precomputed = HierarchicalClustering.from_distances(
+                    distances, data, linkage=linkage)
+                self.assertEqual(precomputed.getlevel(40), cl.getlevel(40))
+                self.assertEqual(precomputed.topo(), cl.topo())
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def testFromDistancesNumpy(self):
+        data = sorted(set(self.__data))
+        square = numpy.array([[abs(x - y) for y in data] for x in data],
+                             dtype=float)
+        cl = HierarchicalClustering(data, lambda x, y: abs(x - y))
+        precomputed = HierarchicalClustering.from_distances(square, data)
+        self.assertEqual(precomputed.storage, 'condensed')
+        self.assertEqual(precomputed.getlevel(40), cl.getlevel(40))
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'distances.npy')
+            numpy.save(path, square)
+            mapped = HierarchicalClustering.from_distances(path, data)
+            self.assertEqual(mapped.storage, 'mapped')
+            self.assertEqual(mapped.getlevel(40), cl.getlevel(40))
+            listed = HierarchicalClustering.from_distances(path, data,
+                                                           storage='list')
+            self.assertEqual(listed.storage, 'list')
+        finally:
+            shutil.rmtree(directory)
+
+    def testFromDistancesDefaultLabels(self):
+        cl = HierarchicalClustering.from_distances([2, 9, 8, 1, 7, 9])
+        self.assertEqual(cl.getlevel(5), [[3], [0, 1, 2]])
+
     def testMultiprocessing(self):
         cl = HierarchicalClustering(self.__data, lambda x, y: abs(x - y),
                                     num_processes=4)
@@ -168,6 +349,203 @@ class HClusterIntegerTestCase(Py23TestCase):
         [new_data.extend(_) for _ in cl.getlevel(40)]
         self.assertEqual(sorted(new_data), sorted(self.__data))
 
+    def testMultiprocessingUclus(self):
+        cl = HierarchicalClustering(self.__data, lambda x, y: abs(x - y),
+                                    linkage='uclus')
+        parallel = HierarchicalClustering(self.__data,
+                                          lambda x, y: abs(x - y),
+                                          linkage='uclus',
+                                          num_processes=3)
+        self.assertEqual(parallel.getlevel(40), cl.getlevel(40))
+        self.assertEqual(parallel.topo(), cl.topo())
+
+    @unittest.skipIf(workers.ThreadPoolExecutor is None,
+                     'concurrent.futures is not installed')
+    def testThreads(self):
+        for linkage in ('single', 'uclus'):
+            cl = HierarchicalClustering(self.__data, lambda x, y: abs(x - y),
+                                        linkage=linkage)
+            threaded = HierarchicalClustering(self.__data,
+                                              lambda x, y: abs(x - y),
+                                              linkage=linkage,
+                                              num_processes=3,
+                                              executor='threads')
+            self.assertEqual(threaded.getlevel(40), cl.getlevel(40))
+            self.assertEqual(threaded.topo(), cl.topo())
+
+    def testCompact(self):
+        for linkage in ('single', 'complete', 'average', 'uclus'):
+            cl = HierarchicalClustering(self.__data, lambda x, y: abs(x - y),
+                                        linkage=linkage)
+            compact = HierarchicalClustering(self.__data,
+                                             lambda x, y: abs(x - y),
+                                             linkage=linkage,
+                                             compact=True)
+            self.assertEqual(compact.getlevel(40), cl.getlevel(40))
+            self.assertEqual(compact.topo(), cl.topo())
+            self.assertIsInstance(compact.data[0], LinkageTree)
+            self.assertEqual(list(compact.data[0]), list(cl.data[0]))
+            self.assertEqual(compact.data[0].cluster().topology(), cl.topo())
+            self.assertEqual(len(cl.linkage_tree.merges),
+                             len(self.__data) - 1)
+
+    def testGetlevels(self):
+        for linkage in ('single', 'complete', 'average', 'uclus'):
+            cl = HierarchicalClustering(self.__data, lambda x, y: abs(x - y),
+                                        linkage=linkage)
+            thresholds = [40, 0, 300, 10, 100, 40]
+            self.assertEqual(cl.getlevels(thresholds),
+                             [cl.getlevel(threshold)
+                              for threshold in thresholds])
+
+    def testCutK(self):
+        cl = HierarchicalClustering(self.__data, lambda x, y: abs(x - y))
+        result = [sorted(_) for _ in cl.cut_k(8)]
+        self.assertCItemsEqual([
+            [24],
+            [336, 365, 365, 391, 398],
+            [518, 542, 564, 594],
+            [676],
+            [791],
+            [835],
+            [84, 124, 131, 134],
+            [940, 956, 971],
+        ], result)
+        self.assertEqual(len(cl.cut_k(1)), 1)
+        self.assertEqual(len(cl.cut_k(len(self.__data))), len(self.__data))
+        self.assertRaises(ValueError, cl.cut_k, 0)
+
+
+class LinkageTreeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # ((1, 2), (10, (11, 13)))
+        self.tree = LinkageTree([1, 2, 10, 11, 13])
+        self.tree.add(0, 1, 1)   # 5
+        self.tree.add(3, 4, 2)   # 6
+        self.tree.add(2, 6, 3)   # 7
+        self.tree.add(5, 7, 8)   # 8
+
+    def testMerges(self):
+        self.assertEqual(self.tree.root, 8)
+        self.assertEqual(self.tree.merges[-1], (5, 7, 8.0, 5))
+        self.assertEqual(self.tree.size(7), 3)
+
+    def testIteration(self):
+        self.assertEqual(list(self.tree), [1, 2, 10, 11, 13])
+        self.assertEqual(self.tree.topology(), ((1, 2), (10, (11, 13))))
+
+    def testGetlevel(self):
+        self.assertEqual(self.tree.getlevel(10), [[1, 2, 10, 11, 13]])
+        self.assertEqual(self.tree.getlevel(3), [[1, 2], [10, 11, 13]])
+        self.assertEqual(self.tree.getlevel(2), [[1, 2], [10], [11, 13]])
+        self.assertEqual(self.tree.getlevel(0),
+                         [[1], [2], [10], [11], [13]])
+        for threshold in range(10):
+            self.assertEqual(self.tree.getlevel(threshold),
+                             self.tree.cluster().getlevel(threshold))
+
+    def testGetlevels(self):
+        self.assertEqual(self.tree.getlevels([2, 10, 0, 3]), [
+            [[1, 2], [10], [11, 13]],
+            [[1, 2, 10, 11, 13]],
+            [[1], [2], [10], [11], [13]],
+            [[1, 2], [10, 11, 13]],
+        ])
+
+    def testCutK(self):
+        self.assertEqual(self.tree.cut_k(1), [[1, 2, 10, 11, 13]])
+        self.assertEqual(self.tree.cut_k(2), [[1, 2], [10, 11, 13]])
+        self.assertEqual(self.tree.cut_k(3), [[1, 2], [10], [11, 13]])
+        self.assertEqual(self.tree.cut_k(4), [[1, 2], [10], [11], [13]])
+        self.assertRaises(ValueError, self.tree.cut_k, 6)
+
+
+class DeepClusterTestCase(unittest.TestCase):
+    """
+    Chain-like trees (as produced by single linkage) are deeper than the
+    recursion limit.
+    """
+
+    def setUp(self):
+        self.size = 5000
+        self.cluster = 0
+        for item in range(1, self.size):
+            self.cluster = Cluster(item, self.cluster, item)
+
+    def testIteration(self):
+        self.assertEqual(list(self.cluster), list(range(self.size)))
+        self.assertEqual(fullyflatten(self.cluster.items),
+                         list(range(self.size)))
+
+    def testGetlevel(self):
+        result = self.cluster.getlevel(10)
+        self.assertEqual(result[0], list(range(11)))
+        self.assertEqual(result[1:], [[item]
+                                      for item in range(11, self.size)])
+
+    def testTopology(self):
+        topology = self.cluster.topology()
+        self.assertEqual(topology[1], self.size - 1)
+        self.assertEqual(topology[0][1], self.size - 2)
+
+    def testFlatten(self):
+        nested = [0]
+        for item in range(1, self.size):
+            nested = [nested, item]
+        self.assertEqual(flatten(nested), list(range(self.size)))
+        self.assertEqual(flatten([1, [2, [], (3, 4)], 5]),
+                         [1, 2, (3, 4), 5])
+
+
+class SingleLinkageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.data = [791, 956, 676, 124, 564, 84, 24, 365, 594, 940, 398,
+                     971, 131, 542, 336, 518, 835, 134, 391]
+        self.distance = lambda x, y: abs(x - y)  # NOQA
+
+    def testEqualsMatrix(self):
+        cl = HierarchicalClustering(self.data, self.distance)
+        mst = SingleLinkageClustering(self.data, self.distance)
+        self.assertEqual(mst.getlevel(40), cl.getlevel(40))
+        self.assertEqual(mst.topo(), cl.topo())
+        self.assertEqual(mst.cut_k(5), cl.cut_k(5))
+
+    def testCompact(self):
+        mst = SingleLinkageClustering(self.data, self.distance)
+        compact = SingleLinkageClustering(self.data, self.distance,
+                                          compact=True)
+        self.assertIsInstance(compact.data[0], int)
+        self.assertEqual(compact.getlevels([10, 40, 100]),
+                         mst.getlevels([10, 40, 100]))
+        self.assertIsInstance(compact.data[0], LinkageTree)
+
+    def testDistanceCalls(self):
+        calls = []
+
+        def distance(x, y):
+            calls.append((x, y))
+            return abs(x - y)
+
+        SingleLinkageClustering(self.data, distance).cluster()
+        self.assertEqual(len(calls),
+                         len(self.data) * (len(self.data) - 1) // 2)
+
+    def testFromDistances(self):
+        distances = [[abs(x - y) for y in self.data] for x in self.data]
+        mst = SingleLinkageClustering.from_distances(distances, self.data)
+        cl = HierarchicalClustering(self.data, self.distance)
+        self.assertEqual(mst.getlevel(40), cl.getlevel(40))
+
+    def testSmallData(self):
+        self.assertEqual(SingleLinkageClustering([], self.distance)
+                         .getlevel(1), [])
+        self.assertEqual(SingleLinkageClustering([5], self.distance)
+                         .getlevel(1), [5])
+        self.assertEqual(SingleLinkageClustering([5, 7], self.distance)
+                         .getlevel(1), [[5], [7]])
+
 
 class HClusterStringTestCase(Py23TestCase):
 
@@ -266,6 +644,9 @@ if __name__ == '__main__':
         unittest.makeSuite(HClusterSmallListTestCase),
         unittest.makeSuite(HClusterStringTestCase),
         unittest.makeSuite(Issue28TestCase),
+        unittest.makeSuite(LinkageTreeTestCase),
+        unittest.makeSuite(DeepClusterTestCase),
+        unittest.makeSuite(SingleLinkageTestCase),
     ))
 
     logging.basicConfig(level=logging.DEBUG)
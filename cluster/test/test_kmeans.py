@@ -15,7 +15,9 @@
 # 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
 #
 
-from cluster import (KMeansClustering, ClusteringError)
+from cluster import (KMeansClustering, MiniBatchKMeansClustering,
+                     ClusteringError)
+from cluster import workers
 import unittest
 
 
@@ -105,7 +107,191 @@ class KCluster2DTestCase(unittest.TestCase):
         self.assertEqual(
             cl.getclusters(2),
             [[(8, 2), (8, 1), (8, 3), (7, 3), (9, 2), (9, 3)],
-             [(3, 5), (1, 5), (3, 4), (2, 6), (2, 5), (3, 6)]])
+             [(3, 5), (1, 5), (3, 4), (2, 6), (3, 6), (2, 5)]])
+
+    def testBatchUpdate(self):
+        "Clustering test using batch updates of the centroids"
+        data = [(8, 2), (7, 3), (2, 6), (3, 5), (3, 6), (1, 5), (8, 1),
+                (3, 4), (8, 3), (9, 2), (2, 5), (9, 3)]
+        cl = KMeansClustering(data, update='batch')
+        expected = [[(8, 2), (8, 1), (8, 3), (7, 3), (9, 2), (9, 3)],
+                    [(3, 5), (1, 5), (3, 4), (2, 6), (2, 5), (3, 6)]]
+        self.assertTrue(compare_list(cl.getclusters(2), expected))
+
+    def testInit(self):
+        "Clustering test using the different seeding methods"
+        data = [(8, 2), (7, 3), (2, 6), (3, 5), (3, 6), (1, 5), (8, 1),
+                (3, 4), (8, 3), (9, 2), (2, 5), (9, 3)]
+        expected = [[(8, 2), (8, 1), (8, 3), (7, 3), (9, 2), (9, 3)],
+                    [(3, 5), (1, 5), (3, 4), (2, 6), (2, 5), (3, 6)]]
+        for init in ('k-means++', 'k-means||'):
+            for seed in range(10):
+                cl = KMeansClustering(data, init=init, seed=seed)
+                self.assertTrue(compare_list(cl.getclusters(2), expected))
+        first = KMeansClustering(data, init='random', seed=42)
+        second = KMeansClustering(data, init='random', seed=42)
+        self.assertEqual(first.getclusters(3), second.getclusters(3))
+        self.assertRaises(ValueError, KMeansClustering, data, init='foo')
+
+    def testLabels(self):
+        "Each item is visited once per pass, duplicates are kept apart"
+        data = [(1, 1), (1, 1), (9, 9), (9, 9), (1, 2), (9, 8)]
+        cl = KMeansClustering(data)
+        clusters = cl.getclusters(2)
+        self.assertEqual(clusters, [[(1, 1), (1, 2), (1, 1)],
+                                    [(9, 9), (9, 8), (9, 9)]])
+        self.assertEqual(cl.labels, [0, 0, 1, 1, 0, 1])
+        self.assertEqual(cl.counts, [3, 3])
+        self.assertEqual(cl.iterations, 2)
+
+    def testMoveItem(self):
+        "The items and clusters are passed to assign_item and move_item"
+        cl = KMeansClustering([(1, 1), (9, 9), (1, 2), (9, 8)])
+        cl.getclusters(2)
+        first, second = cl.clusters
+        cl.move_item((1, 2), first, second)
+        self.assertEqual(cl.clusters, [[(1, 1)], [(9, 9), (9, 8), (1, 2)]])
+        self.assertEqual(cl.labels, [0, 1, 1, 1])
+        self.assertTrue(cl.assign_item((1, 2), cl.clusters[1]))
+        self.assertEqual(cl.clusters, [[(1, 1), (1, 2)], [(9, 9), (9, 8)]])
+        self.assertFalse(cl.assign_item((9, 8), cl.clusters[1]))
+        self.assertRaises(ValueError, cl.move_item, (5, 5), first, second)
+
+    def testConvergence(self):
+        "Convergence controls and reporting"
+        data = [(8, 2), (7, 3), (2, 6), (3, 5), (3, 6), (1, 5), (8, 1),
+                (3, 4), (8, 3), (9, 2), (2, 5), (9, 3)]
+        for update in ('online', 'batch'):
+            cl = KMeansClustering(data, update=update)
+            cl.getclusters(2)
+            self.assertTrue(cl.converged)
+            self.assertTrue(cl.iterations > 1)
+
+            limited = KMeansClustering(data, update=update, max_iter=1)
+            limited.getclusters(2)
+            self.assertEqual(limited.iterations, 1)
+            self.assertFalse(limited.converged)
+
+            tolerant = KMeansClustering(data, update=update, tolerance=100)
+            tolerant.getclusters(2)
+            self.assertEqual(tolerant.iterations, 1)
+            self.assertTrue(tolerant.converged)
+
+            moved = KMeansClustering(data, update=update, moved_fraction=1)
+            moved.getclusters(2)
+            self.assertEqual(moved.iterations, 1)
+            self.assertTrue(moved.converged)
+
+    def testMetricBounds(self):
+        "The bounds of a metric distance skip distance calculations"
+        from cluster.util import minkowski_distance
+        from random import Random
+        calls = []
+
+        def distance(x, y):
+            calls.append(1)
+            return minkowski_distance(x, y)
+
+        rng = Random(1)
+        data = [(x + rng.random(), y + rng.random())
+                for x in range(0, 100, 10) for y in range(0, 100, 10)
+                for _ in range(5)]
+        results = []
+        for metric in (False, True):
+            del calls[:]
+            cl = KMeansClustering(data, distance, update='batch',
+                                  metric=metric)
+            results.append((cl.getclusters(10), cl.iterations, len(calls)))
+        self.assertEqual(results[0][:2], results[1][:2])
+        self.assertTrue(results[1][2] < results[0][2] / 2)
+
+    def testElkanBounds(self):
+        "Many clusters keep one bound per centroid, with the same result"
+        from cluster.method.kmeans import ELKAN_CLUSTERS
+        from cluster.util import minkowski_distance
+        from random import Random
+        calls = []
+
+        def distance(x, y):
+            calls.append(1)
+            return minkowski_distance(x, y)
+
+        rng = Random(1)
+        data = [(x + rng.random(), y + rng.random())
+                for x in range(0, 100, 10) for y in range(0, 100, 10)
+                for _ in range(2)]
+        for init in ('round-robin', 'k-means++'):
+            results = []
+            for metric in (False, True):
+                del calls[:]
+                cl = KMeansClustering(data, distance, update='batch',
+                                      init=init, seed=1, metric=metric)
+                results.append((cl.getclusters(ELKAN_CLUSTERS + 8),
+                                cl.iterations, len(calls)))
+            self.assertEqual(results[0][:2], results[1][:2])
+            self.assertTrue(results[1][2] < results[0][2] / 2)
+
+    def testIndex(self):
+        "The spatial indices find the same clusters"
+        data = [(8, 2), (7, 3), (2, 6), (3, 5), (3, 6), (1, 5), (8, 1),
+                (3, 4), (8, 3), (9, 2), (2, 5), (9, 3)]
+        manhattan = lambda x, y: abs(x[0] - y[0]) + abs(x[1] - y[1])
+        for distance, index in ((None, 'kd-tree'), (manhattan, 'ball-tree')):
+            cl = KMeansClustering(data, distance, update='batch',
+                                  metric=False)
+            indexed = KMeansClustering(data, distance, update='batch',
+                                       index=index)
+            self.assertEqual(indexed.getclusters(3), cl.getclusters(3))
+            self.assertEqual(indexed.predict([(0, 0), (9, 9)]),
+                             cl.predict([(0, 0), (9, 9)]))
+        self.assertRaises(ValueError, KMeansClustering, data, manhattan,
+                          index='kd-tree')
+
+    def testPredict(self):
+        data = [(8, 2), (7, 3), (2, 6), (3, 5), (3, 6), (1, 5), (8, 1),
+                (3, 4), (8, 3), (9, 2), (2, 5), (9, 3)]
+        cl = KMeansClustering(data)
+        self.assertRaises(ClusteringError, cl.predict, [(1, 1)])
+        cl.getclusters(2)
+        self.assertEqual(cl.predict([(9, 1), (0, 6)]), [0, 1])
+
+    def testParallel(self):
+        "Parallel assignment gives the same clusters"
+        data = [(8, 2), (7, 3), (2, 6), (3, 5), (3, 6), (1, 5), (8, 1),
+                (3, 4), (8, 3), (9, 2), (2, 5), (9, 3)]
+        expected = KMeansClustering(data, update='batch').getclusters(3)
+        executors = ['processes', 'serial']
+        if workers.ThreadPoolExecutor is not None:
+            executors.append('threads')
+        for executor in executors:
+            cl = KMeansClustering(data, update='batch', num_processes=2,
+                                  executor=executor)
+            self.assertEqual(cl.getclusters(3), expected)
+            self.assertIsNone(cl.pool)
+        self.assertRaises(ValueError, KMeansClustering, data,
+                          num_processes=2)
+        self.assertRaises(ValueError, KMeansClustering, data,
+                          update='batch', executor='foo')
+
+    def testPersistentWorkers(self):
+        "A pool started by the caller is kept until stop_workers()"
+        data = [(8, 2), (7, 3), (2, 6), (3, 5), (3, 6), (1, 5), (8, 1),
+                (3, 4), (8, 3), (9, 2), (2, 5), (9, 3)]
+        expected = KMeansClustering(data, update='batch').getclusters(3)
+        cl = KMeansClustering(data, update='batch')
+        cl.start_workers(3)
+        try:
+            pool = cl.pool
+            self.assertEqual(cl.getclusters(3), expected)
+            self.assertEqual(cl.getclusters(3), expected)
+            self.assertIs(cl.pool, pool)
+        finally:
+            cl.stop_workers()
+        self.assertIsNone(cl.pool)
+
+    def testInvalidUpdate(self):
+        self.assertRaises(ValueError, KMeansClustering, [(1, 1)],
+                          update='foo')
 
     def testUnmodifiedData(self):
         "Basic clustering test"
@@ -118,6 +304,42 @@ class KCluster2DTestCase(unittest.TestCase):
         self.assertEqual(sorted(new_data), sorted(data))
 
 
+class MiniBatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.data = [(8, 2), (7, 3), (2, 6), (3, 5), (3, 6), (1, 5), (8, 1),
+                     (3, 4), (8, 3), (9, 2), (2, 5), (9, 3)]
+
+    def testFit(self):
+        cl = MiniBatchKMeansClustering(2)
+        cl.fit((item for item in self.data * 5), batch_size=4)
+        labels = cl.predict(self.data)
+        clusters = [[item for item, label in zip(self.data, labels)
+                     if label == index] for index in range(2)]
+        expected = [[(8, 2), (8, 1), (8, 3), (7, 3), (9, 2), (9, 3)],
+                    [(3, 5), (1, 5), (3, 4), (2, 6), (2, 5), (3, 6)]]
+        self.assertTrue(compare_list(clusters, expected))
+        self.assertEqual(sum(cl.counts), len(self.data) * 5)
+
+    def testPartialFit(self):
+        cl = MiniBatchKMeansClustering(2, init='random', seed=1)
+        cl.partial_fit([(0, 0), (10, 10), (0, 2)])
+        cl.centroids = [(0, 0), (10, 10)]
+        cl.counts = [1, 1]
+        cl.partial_fit([(0, 2), (0, 4), (12, 10)])
+        self.assertEqual(cl.centroids, [(0.0, 2.0), (11.0, 10.0)])
+        self.assertEqual(cl.counts, [3, 2])
+        self.assertEqual(cl.predict([(1, 1), (9, 9)]), [0, 1])
+
+    def testErrors(self):
+        self.assertRaises(ClusteringError, MiniBatchKMeansClustering, 1)
+        cl = MiniBatchKMeansClustering(3)
+        self.assertRaises(ClusteringError, cl.predict, [(1, 1)])
+        self.assertRaises(ClusteringError, cl.partial_fit, [(1, 1), (2, 2)])
+        self.assertRaises(ValueError, MiniBatchKMeansClustering, 2,
+                          init='round-robin')
+
+
 class KClusterSFBugs(unittest.TestCase):
 
     def testLostFunctionReference(self):
@@ -1,6 +1,10 @@
+from __future__ import division
 import unittest
 
-from cluster.linkage import single, complete, uclus, average
+from cluster.linkage import (single, complete, uclus, average, ward,
+                             INDEX_LINKAGES, ItemLinkage, LinkageCache)
+from cluster.matrix import DistanceMatrix
+from cluster.util import minkowski_distance
 
 
 class LinkageMethods(unittest.TestCase):
@@ -30,12 +34,121 @@ class LinkageMethods(unittest.TestCase):
         expected = 22.5
         self.assertEqual(result, expected)
 
+    def test_ward_distance(self):
+        result = ward(self.set_a, self.set_b, self.dist)
+        expected = (2 * 4 * 7 / 11) ** 0.5 * (25 - 2.5)
+        self.assertAlmostEqual(result, expected)
+
+    def test_ward_vectors(self):
+        result = ward([(0, 0), (0, 2)], [(4, 1)], minkowski_distance)
+        self.assertAlmostEqual(result, (4 / 3) ** 0.5 * 4)
+        self.assertEqual(ward([(1, 1)], [(4, 5)], minkowski_distance), 5)
+
+
+class IndexLinkageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.items = [1, 2, 3, 4, 10, 11, 12, 13, 14, 15, 100]
+        self.distances = DistanceMatrix([[abs(x - y) for y in self.items]
+                                         for x in self.items])
+        self.set_a = [0, 1, 2, 3]
+        self.set_b = [4, 5, 6, 7, 8, 9, 10]
+
+    def test_builtin_linkages(self):
+        expected = {single: 6, complete: 99, uclus: 10.5, average: 22.5}
+        for linkage, value in expected.items():
+            result = INDEX_LINKAGES[linkage](self.set_a, self.set_b,
+                                             self.distances)
+            self.assertEqual(result, value)
+
+    def test_item_linkage(self):
+        calls = []
+
+        def linkage(a, b, distance_function):
+            calls.append((a, b))
+            return max(distance_function(x, y) for x in a for y in b)
+
+        result = ItemLinkage(linkage, self.items)(self.set_a, self.set_b,
+                                                  self.distances)
+        self.assertEqual(result, 99)
+        self.assertEqual(calls, [([1, 2, 3, 4],
+                                  [10, 11, 12, 13, 14, 15, 100])])
+
+    def test_item_linkage_derived_values(self):
+        def linkage(a, b, distance_function):
+            return distance_function(sum(a) / len(a), sum(b) / len(b))
+
+        wrapped = ItemLinkage(linkage, self.items, lambda x, y: abs(x - y))
+        self.assertEqual(wrapped([0, 1], [4, 5], self.distances), 9)
+        self.assertRaises(ValueError, ItemLinkage(linkage, self.items),
+                          [0, 1], [4, 5], self.distances)
+
+
+class LinkageCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dist = lambda x, y: abs(x-y)  # NOQA
+
+    def test_hits_and_misses(self):
+        cache = LinkageCache()
+        self.assertEqual(cache(average, [1, 2], [3, 4], self.dist), 2)
+        self.assertEqual(cache(average, [1, 2], [3, 4], self.dist), 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_distance_function_in_key(self):
+        cache = LinkageCache()
+        cache(single, [1], [5], self.dist)
+        result = cache(single, [1], [5], lambda x, y: 2 * abs(x-y))
+        self.assertEqual(result, 8)
+        self.assertEqual(cache.hits, 0)
+
+    def test_duplicate_items(self):
+        cache = LinkageCache()
+        cache(average, [1, 1], [3], self.dist)
+        result = cache(average, [1], [3], self.dist)
+        self.assertEqual(result, 2)
+
+    def test_bounded(self):
+        cache = LinkageCache(maxsize=2)
+        cache(single, [1], [2], self.dist)
+        cache(single, [1], [3], self.dist)
+        cache(single, [1], [2], self.dist)  # refreshes [1]/[2]
+        cache(single, [1], [4], self.dist)  # evicts [1]/[3]
+        self.assertEqual(len(cache), 2)
+        cache(single, [1], [2], self.dist)
+        cache(single, [1], [3], self.dist)
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+
+    def test_discard(self):
+        cache = LinkageCache()
+        cache(single, [1], [2], self.dist)
+        cache(single, [1], [3], self.dist)
+        cache(single, [2], [3], self.dist)
+        cache.discard([1])
+        self.assertEqual(len(cache), 1)
+        cache(single, [2], [3], self.dist)
+        cache(single, [1], [2], self.dist)
+        self.assertEqual((cache.hits, cache.misses), (1, 4))
+        cache.clear(counters=False)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.hits, 1)
+
+    def test_disabled(self):
+        cache = LinkageCache(maxsize=0)
+        cache(single, [1], [2], self.dist)
+        cache(single, [1], [2], self.dist)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.misses, 2)
+
+
 if __name__ == '__main__':
 
     import logging
 
     suite = unittest.TestSuite((
         unittest.makeSuite(LinkageMethods),
+        unittest.makeSuite(IndexLinkageTestCase),
+        unittest.makeSuite(LinkageCacheTestCase),
     ))
 
     logging.basicConfig(level=logging.DEBUG)
@@ -0,0 +1,279 @@
+#
+# This is part of "python-cluster". A library to group similar items together.
+# Copyright (C) 2006    Michel Albert
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from cluster.matrix import (CondensedMatrix, DistanceMatrix, MappedMatrix,
+                            Matrix)
+from cluster import matrix, workers
+
+
+def distance(a, b):
+    return abs(a[0] - b[0])
+
+
+class CondensedMatrixTestCase(unittest.TestCase):
+
+    def testSymmetry(self):
+        matrix = CondensedMatrix(4, 0)
+        matrix[1][3] = 5
+        self.assertEqual(matrix[3][1], 5)
+        self.assertEqual(matrix[1, 3], 5)
+        self.assertEqual(matrix[2][2], 0)
+
+    def testSize(self):
+        matrix = CondensedMatrix(5, 0)
+        self.assertEqual(len(matrix.values), 10)
+        self.assertEqual(len(matrix), 5)
+        self.assertEqual(len(matrix[0]), 5)
+
+    def testDiagonalIsReadOnly(self):
+        matrix = CondensedMatrix(3, 0)
+        with self.assertRaises(ValueError):
+            matrix[1][1] = 10
+
+
+@unittest.skipUnless(hasattr(memoryview, 'cast'),
+                     'Memory-mapped matrices require Python 3')
+class MappedMatrixTestCase(unittest.TestCase):
+
+    def testLayout(self):
+        for size in (0, 1, 2, 7, 20):
+            with MappedMatrix(size, 0, tile_size=3) as matrix:
+                positions = set(matrix.index(row, col)
+                                for row in range(size)
+                                for col in range(row + 1, size))
+                self.assertEqual(len(positions), size * (size - 1) // 2)
+                self.assertTrue(all(0 <= position < len(matrix.values)
+                                    for position in positions))
+
+    def testRows(self):
+        condensed = CondensedMatrix(20, 0)
+        with MappedMatrix(20, 0, tile_size=6) as matrix:
+            for row in range(20):
+                cells = [row * 100.0 + col for col in range(row + 1, 20)]
+                condensed.store_upper_row(row, cells)
+                matrix.store_upper_row(row, cells)
+            self.assertEqual([list(row) for row in matrix],
+                             [list(row) for row in condensed])
+            matrix[3][5] = 0.5
+            self.assertEqual(matrix[5, 3], 0.5)
+            self.assertRaises(ValueError, matrix.__setitem__, (2, 2), 1)
+
+    def testPath(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'matrix')
+            matrix = MappedMatrix(100, 0, path=path)
+            matrix[10, 90] = 1.5
+            matrix.flush()
+            matrix.close()
+            self.assertTrue(os.path.getsize(path) >= 100 * 99 // 2 * 8)
+        finally:
+            shutil.rmtree(directory)
+
+
+class DistanceMatrixTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.labels = ['a', 'b', 'c', 'd']
+        self.square = [[0, 1, 5, 2],
+                       [1, 0, 4, 3],
+                       [5, 4, 0, 6],
+                       [2, 3, 6, 0]]
+        self.condensed = [1, 5, 2, 4, 3, 6]
+
+    def check(self, matrix):
+        self.assertEqual(len(matrix), 4)
+        for row, x in enumerate(self.labels):
+            for col, y in enumerate(self.labels):
+                self.assertEqual(matrix[row, col], self.square[row][col])
+                self.assertEqual(matrix(x, y), self.square[row][col])
+
+    def testSquare(self):
+        self.check(DistanceMatrix(self.square, self.labels))
+
+    def testCondensed(self):
+        self.check(DistanceMatrix(self.condensed, self.labels))
+
+    def testDefaultLabels(self):
+        matrix = DistanceMatrix(self.condensed)
+        self.assertEqual(matrix.labels, [0, 1, 2, 3])
+        self.assertEqual(matrix(3, 1), 3)
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed')
+    def testNumpy(self):
+        self.check(DistanceMatrix(numpy.array(self.square), self.labels))
+        self.check(DistanceMatrix(numpy.array(self.condensed), self.labels))
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'distances.npy')
+            numpy.save(path, numpy.array(self.condensed, dtype=float))
+            self.check(DistanceMatrix(path, self.labels))
+        finally:
+            shutil.rmtree(directory)
+
+    def testInvalid(self):
+        self.assertRaises(ValueError, DistanceMatrix, [1, 2])
+        self.assertRaises(ValueError, DistanceMatrix, [[0, 1], [1]])
+        self.assertRaises(ValueError, DistanceMatrix, self.square, ['a', 'b'])
+        self.assertRaises(ValueError, DistanceMatrix, self.square,
+                          ['a', 'b', 'c', 'a'])
+
+    def testLoadmatrix(self):
+        distances = DistanceMatrix(self.square, self.labels)
+        data = ['d', 'b', 'a', 'c']
+        for storage in ('list', 'condensed'):
+            matrix = Matrix(data, None, True, 0, storage)
+            matrix.loadmatrix(distances)
+            self.assertEqual([list(row) for row in matrix.matrix],
+                             [[distances(x, y) for y in data] for x in data])
+
+
+class MatrixTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.data = [7, 1, 12, 4, 4]
+
+    def testCondensedEqualsList(self):
+        full = Matrix(self.data, distance, True, 0)
+        full.genmatrix()
+        condensed = Matrix(self.data, distance, True, 0, 'condensed')
+        condensed.genmatrix()
+        self.assertEqual([list(row) for row in condensed.matrix], full.matrix)
+
+    @unittest.skipUnless(hasattr(memoryview, 'cast'),
+                         'Memory-mapped matrices require Python 3')
+    def testMappedEqualsCondensed(self):
+        condensed = Matrix(self.data, distance, True, 0, 'condensed')
+        condensed.genmatrix()
+        mapped = Matrix(self.data, distance, True, 0, 'mapped')
+        mapped.genmatrix(num_processes=2)
+        try:
+            self.assertEqual([list(row) for row in mapped.matrix],
+                             [list(row) for row in condensed.matrix])
+        finally:
+            mapped.matrix.close()
+
+    @unittest.skipUnless(hasattr(memoryview, 'cast'),
+                         'Memory-mapped matrices require Python 3')
+    def testMappedBlocks(self):
+        "The rows sent back for a mapped matrix come in small blocks"
+        data = list(range(40))
+        condensed = Matrix(data, distance, True, 0, 'condensed')
+        condensed.genmatrix()
+        block_cells = matrix.MAPPED_BLOCK_CELLS
+        matrix.MAPPED_BLOCK_CELLS = 20
+        try:
+            with Matrix(data, distance, True, 0, 'mapped') as mapped:
+                mapped.start_workers(2)
+                for start, stop in mapped._row_blocks():
+                    # one row more than the budget at most
+                    cells = sum(40 - row for row in range(start, stop - 1))
+                    self.assertLess(cells, 20)
+                mapped.genmatrix()
+            self.assertEqual([list(row) for row in mapped.matrix],
+                             [list(row) for row in condensed.matrix])
+            mapped.matrix.close()
+        finally:
+            matrix.MAPPED_BLOCK_CELLS = block_cells
+
+    def testMultiprocessing(self):
+        full = Matrix(self.data, distance, True, 0)
+        full.genmatrix()
+        for storage in ('list', 'condensed'):
+            parallel = Matrix(self.data, distance, True, 0, storage)
+            parallel.genmatrix(num_processes=2)
+            self.assertEqual([list(row) for row in parallel.matrix],
+                             full.matrix)
+
+    def testPersistentWorkers(self):
+        with Matrix(self.data, distance, True, 0) as matrix:
+            matrix.start_workers(2)
+            pool = matrix.pool
+            matrix.genmatrix(num_processes=2)
+            matrix.genmatrix(num_processes=2)
+            self.assertIs(matrix.pool, pool)
+            self.assertEqual(matrix.combine_groups([[0], [1, 3]], [2]),
+                             [5, 11])
+        self.assertIsNone(matrix.pool)
+
+    def testSharedBuffer(self):
+        full = Matrix(self.data, distance, True, 0, 'condensed')
+        full.genmatrix()
+        with Matrix(self.data, distance, True, 0, 'condensed') as matrix:
+            matrix.start_workers(2)
+            matrix.genmatrix()
+            self.assertIsNotNone(matrix.buffer)
+            self.assertEqual(list(matrix.matrix.values),
+                             list(full.matrix.values))
+        # the values stay available after the workers have been stopped
+        self.assertEqual(matrix.matrix[0][2], 5)
+
+    @unittest.skipIf(workers.ThreadPoolExecutor is None,
+                     'concurrent.futures is not installed')
+    def testThreads(self):
+        full = Matrix(self.data, distance, True, 0)
+        full.genmatrix()
+        for storage in ('list', 'condensed'):
+            threaded = Matrix(self.data, distance, True, 0, storage,
+                              executor='threads')
+            threaded.genmatrix(num_processes=3)
+            self.assertEqual([list(row) for row in threaded.matrix],
+                             full.matrix)
+            self.assertIsNone(threaded.pool)
+
+    def testSerialExecutor(self):
+        with Matrix(self.data, distance, True, 0,
+                    executor='serial') as matrix:
+            matrix.start_workers(4)
+            self.assertIsNone(matrix.pool)
+            matrix.genmatrix(num_processes=4)
+            self.assertEqual(matrix.matrix[0][2], 5)
+
+    def testInvalidExecutor(self):
+        with self.assertRaises(ValueError):
+            Matrix(self.data, distance, executor='foo')
+
+    def testCondensedNeedsSymmetry(self):
+        with self.assertRaises(ValueError):
+            Matrix(self.data, distance, False, 0, 'condensed')
+        with self.assertRaises(ValueError):
+            Matrix(self.data, distance, True, None, 'condensed')
+
+
+if __name__ == '__main__':
+
+    import logging
+
+    suite = unittest.TestSuite((
+        unittest.makeSuite(CondensedMatrixTestCase),
+        unittest.makeSuite(MappedMatrixTestCase),
+        unittest.makeSuite(DistanceMatrixTestCase),
+        unittest.makeSuite(MatrixTestCase),
+    ))
+
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.TextTestRunner(verbosity=2).run(suite)
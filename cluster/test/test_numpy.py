@@ -18,6 +18,7 @@
 import unittest
 
 from cluster import KMeansClustering
+from cluster.util import minkowski_distance, minkowski_distances
 try:
     import numpy
     NUMPY_AVAILABLE = True
@@ -34,3 +35,41 @@ class NumpyTests(unittest.TestCase):
         cl = KMeansClustering(data, lambda p0, p1: (
             p0[0] - p1[0]) ** 2 + (p0[1] - p1[1]) ** 2, numpy.array_equal)
         cl.getclusters(10)
+
+    def testNumpyDefaultDistance(self):
+        data = numpy.random.rand(100, 3)
+        cl = KMeansClustering(data)
+        clusters = cl.getclusters(4)
+        self.assertEqual(sum(len(cluster) for cluster in clusters), 100)
+
+    def testVectorizedDistances(self):
+        items = numpy.random.rand(20, 3)
+        points = numpy.random.rand(4, 3)
+        result = minkowski_distances(items, points)
+        self.assertEqual(result.shape, (20, 4))
+        for i, item in enumerate(items):
+            for j, point in enumerate(points):
+                self.assertAlmostEqual(result[i][j],
+                                       minkowski_distance(item, point))
+
+    def testVectorizedTuples(self):
+        items = [tuple(row) for row in numpy.random.rand(20, 3).tolist()]
+        points = [(0.5, 0.5, 0.5), (0, 0, 1)]
+        result = minkowski_distances(items, points)
+        self.assertEqual(result.shape, (20, 2))
+        for i, item in enumerate(items):
+            for j, point in enumerate(points):
+                self.assertAlmostEqual(result[i][j],
+                                       minkowski_distance(item, point))
+        # too few distances to pay for the conversion
+        self.assertIsInstance(minkowski_distances(items[:2], points), list)
+
+    def testVectorizedTupleClusters(self):
+        data = [tuple(row) for row in numpy.random.rand(200, 2).tolist()]
+        cl = KMeansClustering(data, update='batch', seed=1)
+        self.assertFalse(cl.metric)
+        bounded = KMeansClustering(data, update='batch', seed=1,
+                                   metric=True)
+        bounded.getclusters(5)
+        cl.getclusters(5)
+        self.assertEqual(cl.labels, bounded.labels)
@@ -0,0 +1,77 @@
+#
+# This is part of "python-cluster". A library to group similar items together.
+# Copyright (C) 2006    Michel Albert
+#
+# This library is free software; you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the Free
+# Software Foundation; either version 2.1 of the License, or (at your option)
+# any later version.
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+#
+
+from random import Random
+import unittest
+
+from cluster.spatial import BallTree, KDTree, build_index
+from cluster.util import minkowski_distance
+
+
+def manhattan(a, b):
+    return sum(abs(x - y) for x, y in zip(a, b))
+
+
+class SpatialIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rng = Random(1)
+        # integer coordinates give many ties
+        self.points = [(rng.randint(0, 20), rng.randint(0, 20))
+                       for _ in range(300)]
+        self.queries = [(rng.uniform(-5, 25), rng.uniform(-5, 25))
+                        for _ in range(50)] + self.points[:10]
+
+    def brute_force(self, point, k, distance):
+        return sorted((distance(point, other), index)
+                      for index, other in enumerate(self.points))[:k]
+
+    def testKDTree(self):
+        tree = KDTree(self.points)
+        for point in self.queries:
+            for k in (1, 3):
+                self.assertEqual(tree.query(point, k),
+                                 self.brute_force(point, k,
+                                                  minkowski_distance))
+
+    def testBallTree(self):
+        tree = BallTree(self.points, manhattan)
+        for point in self.queries:
+            for k in (1, 3):
+                self.assertEqual(tree.query(point, k),
+                                 self.brute_force(point, k, manhattan))
+
+    def testNearest(self):
+        tree = KDTree([(1, 1), (5, 3), (9, 9), (5, 3)])
+        self.assertEqual(tree.nearest((5, 4)), (1, 1.0))
+        self.assertEqual(KDTree([]).query((1, 1)), [])
+
+    def testBuildIndex(self):
+        self.assertIsInstance(build_index(self.points), KDTree)
+        self.assertIsInstance(build_index(self.points, manhattan), BallTree)
+
+
+if __name__ == '__main__':
+
+    import logging
+
+    suite = unittest.TestSuite((
+        unittest.makeSuite(SpatialIndexTestCase),
+    ))
+
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -18,9 +18,23 @@
 from __future__ import print_function
 import logging
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 logger = logging.getLogger(__name__)
 
+#: The number of rows processed at once by the vectorized distance kernels.
+#: This limits the size of the temporary arrays.
+VECTORIZED_CHUNK_SIZE = 1024
+
+#: The minimum number of distances for which :py:func:`minkowski_distances`
+#: converts sequences of tuples to NumPy arrays. For fewer distances, the
+#: conversion costs more than it saves.
+VECTORIZED_MIN_DISTANCES = 16
+
 
 class ClusteringError(Exception):
     pass
@@ -38,10 +52,17 @@ def flatten(L):
     if not isinstance(L, list):
         return [L]
 
-    if L == []:
-        return L
-
-    return flatten(L[0]) + flatten(L[1:])
+    flattened_items = []
+    stack = [iter(L)]
+    while stack:
+        for item in stack[-1]:
+            if isinstance(item, list):
+                stack.append(iter(item))
+                break
+            flattened_items.append(item)
+        else:
+            stack.pop()
+    return flattened_items
 
 
 def fullyflatten(container):
@@ -53,13 +74,15 @@ def fullyflatten(container):
     :param container: the container to flatten.
     """
     flattened_items = []
-
-    for item in container:
-        if hasattr(item, 'items'):
-            flattened_items = flattened_items + fullyflatten(item.items)
-        else:
+    stack = [iter(container)]
+    while stack:
+        for item in stack[-1]:
+            if hasattr(item, 'items'):
+                stack.append(iter(item.items))
+                break
             flattened_items.append(item)
-
+        else:
+            stack.pop()
     return flattened_items
 
 
@@ -100,28 +123,104 @@ def minkowski_distance(x, y, p=2):
     from math import pow
     assert len(y) == len(x)
     assert len(x) >= 1
-    sum = 0
-    for i in range(len(x)):
-        sum += abs(x[i] - y[i]) ** p
-    return pow(sum, 1.0 / float(p))
+    return pow(sum(abs(a - b) ** p for a, b in zip(x, y)), 1.0 / float(p))
+
+
+def is_array(data):
+    """
+    Returns ``True`` if *data* is a NumPy array, or a sequence of NumPy arrays.
+    Always returns ``False`` if NumPy is not installed.
+    """
+    if numpy is None:
+        return False
+    if isinstance(data, numpy.ndarray):
+        return True
+    return len(data) > 0 and isinstance(data[0], numpy.ndarray)
+
+
+def as_vectors(items):
+    """
+    Returns *items* as 2D NumPy array of floats, or ``None`` if NumPy is not
+    installed or the items are not numeric vectors of the same length.
+    """
+    if numpy is None:
+        return None
+    try:
+        vectors = numpy.asarray(items, dtype=float)
+    except (TypeError, ValueError):
+        return None
+    if vectors.ndim != 2:
+        return None
+    return vectors
+
+
+def _as_arrays(items, points):
+    """
+    Returns *items* and *points* as 2D arrays of floats for
+    :py:func:`minkowski_distances`, or ``None`` if they are not vectorized.
+    """
+    if numpy is None:
+        return None
+    if is_array(items) or is_array(points):
+        return (numpy.asarray(items, dtype=float),
+                numpy.asarray(points, dtype=float))
+    if len(items) * len(points) < VECTORIZED_MIN_DISTANCES:
+        return None
+    items = as_vectors(items)
+    points = as_vectors(points)
+    if (items is None or points is None or
+            items.shape[1] != points.shape[1]):
+        return None
+    return items, points
+
+
+def minkowski_distances(items, points, p=2):
+    """
+    Calculates the minkowski distances between each of the *items* and each of
+    the *points* in one call.
+
+    If NumPy is available and one of the inputs contains NumPy arrays, or
+    both are sequences of numeric tuples of the same length and at least
+    :py:data:`VECTORIZED_MIN_DISTANCES` distances are needed, the inputs are
+    converted to arrays and the distances are calculated using vectorized
+    operations. A 2D array is returned then. Otherwise a list of rows is
+    returned, containing the same values as :py:func:`minkowski_distance`.
+
+    :param items: a sequence of points.
+    :param points: another sequence of points (for example centroids).
+    :param p: the order of the minkowski algorithm (see
+        :py:func:`minkowski_distance`).
+    :return: A matrix with one row per item, and one column per point.
+    """
+    arrays = _as_arrays(items, points)
+    if arrays is not None:
+        items, points = arrays
+        output = numpy.empty((len(items), len(points)))
+        for start in range(0, len(items), VECTORIZED_CHUNK_SIZE):
+            chunk = items[start:start + VECTORIZED_CHUNK_SIZE]
+            differences = numpy.abs(chunk[:, numpy.newaxis, :] -
+                                    points[numpy.newaxis, :, :])
+            output[start:start + len(chunk)] = (
+                (differences ** p).sum(axis=2) ** (1.0 / p))
+        return output
+
+    from math import pow
+    exponent = 1.0 / float(p)
+    return [[pow(sum(abs(a - b) ** p for a, b in zip(item, point)), exponent)
+             for point in points]
+            for item in items]
 
 
 def magnitude(a):
     "calculates the magnitude of a vecor"
     from math import sqrt
-    sum = 0
-    for coord in a:
-        sum += coord ** 2
-    return sqrt(sum)
+    return sqrt(sum(coord ** 2 for coord in a))
 
 
 def dotproduct(a, b):
     "Calculates the dotproduct between two vecors"
     assert(len(a) == len(b))
-    out = 0
-    for i in range(len(a)):
-        out += a[i] * b[i]
-    return out
+    return sum(x * y for x, y in zip(a, b))
 
 
 def centroid(data, method=median):
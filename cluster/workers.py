@@ -0,0 +1,105 @@
+#
+# This is part of "python-cluster". A library to group similar items together.
+# Copyright (C) 2006    Michel Albert
+#
+# This library is free software; you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation; either version 2.1 of the License, or (at your
+# option) any later version.
+# This library is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License
+# for more details.
+# You should have received a copy of the GNU Lesser General Public License
+# along with this library; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+#
+
+from functools import partial
+import logging
+from multiprocessing import Pool
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    # Python 2 without the "futures" backport
+    ThreadPoolExecutor = None
+
+
+logger = logging.getLogger(__name__)
+
+#: The possible values for the *executor* of a :py:class:`WorkerPool`.
+EXECUTORS = ('serial', 'threads', 'processes')
+
+#: The state of a worker process. It is set once when the worker starts, so
+#: the data does not need to be sent with each task. Worker threads use a state
+#: owned by their :py:class:`WorkerPool` instead.
+_worker_state = {}
+
+
+def check_executor(executor):
+    """
+    Raises a :py:exc:`ValueError` if *executor* is unknown or not available.
+    """
+    if executor not in EXECUTORS:
+        raise ValueError('executor must be one of serial, threads or '
+                         'processes')
+    if executor == 'threads' and ThreadPoolExecutor is None:
+        raise ValueError('The threads executor requires the '
+                         'concurrent.futures module')
+
+
+def _initialise_process(initialiser, args):
+    initialiser(*args, state=_worker_state)
+
+
+def _run_in_process(function, task):
+    return function(task, state=_worker_state)
+
+
+class WorkerPool(object):
+    """
+    A pool of worker processes or threads. Each worker is set up once, when
+    the pool starts, by calling ``initialiser(*args, state=state)``. The
+    *state* is a dictionary which is then passed to every task, so the data
+    does not need to be sent with each task.
+
+    :param executor: ``'threads'`` or ``'processes'``
+    :param num_workers: The number of workers.
+    :param initialiser: Fills the *state* of a worker.
+    :param args: The arguments of *initialiser*.
+    """
+
+    def __init__(self, executor, num_workers, initialiser, args=()):
+        logger.info("Spinning up %s workers (%s)", num_workers, executor)
+        self.executor = executor
+        self.num_workers = num_workers
+        if executor == 'threads':
+            # all threads share one state in this process
+            self.state = {}
+            initialiser(*args, state=self.state)
+            self._pool = ThreadPoolExecutor(num_workers)
+        else:
+            self.state = None
+            self._pool = Pool(num_workers, _initialise_process,
+                              (initialiser, args))
+
+    def map(self, function, tasks):
+        """
+        Runs ``function(task, state=state)`` on each of *tasks*. The results
+        are returned in the order of the tasks.
+        """
+        if self.executor == 'threads':
+            return self._pool.map(partial(function, state=self.state), tasks)
+        return self._pool.imap(partial(_run_in_process, function), tasks)
+
+    def close(self):
+        """
+        Stops the workers once they have finished their tasks.
+        """
+        logger.info("Stopping/joining %s workers", self.num_workers)
+        if self.executor == 'threads':
+            self._pool.shutdown()
+        else:
+            self._pool.close()
+            self._pool.join()